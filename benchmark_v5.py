@@ -0,0 +1,506 @@
+# -*- coding: utf-8 -*-
+
+# external imports
+import pymarc
+
+# Internal import
+import marc_utils_5
+
+# stdlib
+import argparse
+import importlib
+import importlib.metadata
+import inspect
+import io
+import json
+import math
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from typing import List, Callable
+
+# Functions of marc_utils_5 not benchmarked on their own (pure helpers called by benchmarked functions)
+NOT_BENCHMARKED = ["is_tracked", "is_modified", "get_changes", "untrack_changes", "mark_modified", "write_field_as_string", "write_record_as_string",
+    "RuleCondition", "compile_rule_condition", "enable_instrumentation", "disable_instrumentation", "is_instrumentation_enabled",
+    "reset_instrumentation", "get_instrumentation_snapshot", "merge_instrumentation_snapshots", "export_instrumentation", "LazyField",
+    "InternPool", "CompactField", "compact_field", "read_subfields", "compile_combined_pattern",
+    "TagFamily", "get_unimarc_tag_family", "get_dedupe_key"]
+
+# ------------------------------ Synthetic records ------------------------------
+
+DEFAULT_SETTINGS = {
+    "nb_fields": 20,
+    "nb_995": 3,
+    "nb_7XX": 3,
+    "nb_463": 2,
+    "subfield_repeat": 2
+}
+
+__WORDS = ["Love", "Colored", "Master", "Spark", "Summer", "Rose", "histoire", "des", "sciences", "Paris",
+    "Lyon", "roman", "poésie", "musique", "théâtre", "Japon", "France", "économie", "droit", "société"]
+__7XX_TAGS = ["700", "701", "702", "710", "711", "712"]
+__FILLER_TAGS = ["300", "320", "606", "607", "610", "615", "676", "686"]
+
+def __words(rng:random.Random, nb:int) -> str:
+    return " ".join(rng.choice(__WORDS) for _ in range(nb))
+
+def __encode_field(indicators:str, subfields:List[tuple]) -> bytes:
+    """Returns the data of a data field as ISO 2709 bytes (without the field terminator)"""
+    output = indicators.encode("utf-8")
+    for code, value in subfields:
+        output += b"\x1f" + code.encode("utf-8") + value.encode("utf-8")
+    return output
+
+def generate_raw_record(index:int, seed:int=0, nb_fields:int=20, nb_995:int=3, nb_7XX:int=3, nb_463:int=2, subfield_repeat:int=2) -> bytes:
+    """Returns a synthetic UNIMARC record as ISO 2709 bytes (UTF-8).
+    The same index & seed always return the same record, whatever the number of generated records
+
+    Takes as argument :
+        - index {int} : the record number (used in 001)
+        - [OPTIONNAL, 0] seed {int}
+        - [OPTIONNAL, 20] nb_fields {int} : minimum number of fields (filled with 3XX & 6XX)
+        - [OPTIONNAL, 3] nb_995 {int} : number of 995 (some are merged items)
+        - [OPTIONNAL, 3] nb_7XX {int} : number of 70X & 71X
+        - [OPTIONNAL, 2] nb_463 {int} : number of 463 (some with multiple $t)
+        - [OPTIONNAL, 2] subfield_repeat {int} : number of occurrences of repeatable subfields"""
+    rng = random.Random(f"{seed}-{index}")
+    year = rng.randint(1800, 2024)
+    # (tag, data) for control fields, (tag, indicators, subfields) for data fields
+    fields = [("001", f"{index:09d}")]
+    fields.append(("100", "  ", [("a", f"20240101d{year}    m  y0frey0103    ba")]))
+    fields.append(("200", "1 ", [("a", __words(rng, 4))] + [("e", __words(rng, 2)) for _ in range(subfield_repeat)] + [("f", __words(rng, 2))]))
+    fields.append(("214", " 1", [("a", rng.choice(__WORDS)), ("c", __words(rng, 2)), ("d", rng.choice([f"{year}", f"©{year}", f"[{year}]", "DL 2003"]))]))
+    fields.append(("330", "  ", [("a", f"{__words(rng, 12)} en {rng.randint(1800, 2024)}")]))
+    for _ in range(nb_463):
+        subfields = [("t", __words(rng, 3))]
+        # Some 463 are merged
+        if rng.random() < 0.5:
+            subfields += [("t", __words(rng, 3)) for _ in range(subfield_repeat - 1)]
+        fields.append(("463", "  ", subfields + [("v", f"vol. {rng.randint(1, 20)}")]))
+    # Filler fields, sometimes with an empty subfield or surrounding spaces
+    nb_filler = max(0, nb_fields - len(fields) - nb_7XX - nb_995)
+    for _ in range(nb_filler):
+        subfields = [("a", f" {rng.choice(__WORDS)} " if rng.random() < 0.2 else rng.choice(__WORDS)) for _ in range(subfield_repeat)]
+        if rng.random() < 0.2:
+            subfields.append(("x", ""))
+        subfields.append(("2", "rameau"))
+        fields.append((rng.choice(__FILLER_TAGS), "  ", subfields))
+    for _ in range(nb_7XX):
+        fields.append((rng.choice(__7XX_TAGS), " 1", [("a", rng.choice(__WORDS)), ("b", rng.choice(__WORDS)), ("4", rng.choice(["070", "440", "730"]))]))
+    for _ in range(nb_995):
+        # Some 995 are merged items
+        nb_items = subfield_repeat if rng.random() < 0.3 else 1
+        subfields = [("b", "BIB"), ("c", "BIB")]
+        for _ in range(nb_items):
+            subfields += [("f", f"{rng.randint(0, 10**9):010d}"), ("k", rng.choice(["", "A"]) + f"{rng.randint(100, 999)} {rng.choice(__WORDS)[:3].upper()}")]
+        subfields.append(("r", rng.choice(["BOOK", "DVD", "CD"])))
+        fields.append(("995", "  ", subfields))
+    # Unsorted fields so sorting has work to do
+    fields = fields[:1] + sorted(fields[1:], key=lambda field: rng.random())
+
+    # Builds the ISO 2709 record
+    directory = b""
+    data = b""
+    for field in fields:
+        if len(field) == 2:
+            encoded = field[1].encode("utf-8") + b"\x1e"
+        else:
+            encoded = __encode_field(field[1], field[2]) + b"\x1e"
+        directory += f"{field[0]}{len(encoded):04d}{len(data):05d}".encode("ascii")
+        data += encoded
+    base_address = 24 + len(directory) + 1
+    length = base_address + len(data) + 1
+    leader = f"{length:05d}nam a22{base_address:05d}   4500".encode("ascii")
+    return leader + directory + b"\x1e" + data + b"\x1d"
+
+def generate_raw_records(nb_records:int, seed:int=0, **settings) -> List[bytes]:
+    """Returns a list of nb_records synthetic records (see generate_raw_record() for settings)"""
+    return [generate_raw_record(index, seed, **settings) for index in range(nb_records)]
+
+def write_corpus(path:str, nb_records:int, seed:int=0, **settings) -> int:
+    """Writes nb_records synthetic records in an ISO 2709 file, returns the number of bytes written"""
+    with open(path, "wb") as file:
+        return file.write(b"".join(generate_raw_records(nb_records, seed, **settings)))
+
+def parse_raw_records(raws:List[bytes]) -> List[pymarc.record.Record]:
+    """Returns the pymarc records of the raw records"""
+    return list(pymarc.MARCReader(io.BytesIO(b"".join(raws)), to_unicode=True, force_utf8=True))
+
+# ------------------------------ Cases ------------------------------
+
+class Case:
+    """A benchmarked function.
+    Record cases call func once per record, bulk cases call it once with the list of records.
+    If prepare is set, it is called (not timed) on each record (or the list for bulk cases)
+    and its output is given to func instead
+
+    Takes as argument :
+        - module {str} : the module name
+        - name {str} : the benchmarked function name
+        - func : the timed function
+        - [OPTIONNAL, False] bulk {bool}
+        - [OPTIONNAL, None] prepare"""
+
+    def __init__(self, module:str, name:str, func:Callable, bulk:bool=False, prepare:Callable|None=None):
+        self.module = module
+        self.name = name
+        self.func = func
+        self.bulk = bulk
+        self.prepare = prepare
+
+def __for_fields(func:Callable, tag:str|None=None) -> Callable:
+    """Returns a function calling func on every field (with this tag) of a record"""
+    def for_fields(record:pymarc.record.Record):
+        for field in (record.fields if tag is None else record.get_fields(tag)):
+            func(field)
+    return for_fields
+
+def __mutation_batch(record:pymarc.record.Record):
+    fields = record.get_fields("995")
+    with marc_utils_5.FieldMutationBatch(record) as batch:
+        batch.remove_field(*fields)
+        batch.add_ordered_field(*[pymarc.field.Field(field.tag, field.indicators, field.subfields) for field in fields])
+
+def __lazy_record(raw:bytes):
+    record = marc_utils_5.LazyRecord(raw)
+    marc_utils_5.fix_7XX(record)
+    record.as_marc()
+
+def __compacted(record:pymarc.record.Record) -> pymarc.record.Record:
+    marc_utils_5.compact_record(record)
+    return record
+
+def __indexed_record(record:pymarc.record.Record):
+    record = marc_utils_5.IndexedRecord.from_record(record)
+    for tag in ["001", "200", "214", "463", "606", "700", "701", "995", "999"]:
+        record.get_fields(tag)
+
+def __set_field_tag(record:pymarc.record.Record):
+    for field in record.get_fields("702"):
+        marc_utils_5.set_field_tag(record, field, "701")
+
+def __track_changes(record:pymarc.record.Record):
+    marc_utils_5.track_changes(record)
+    marc_utils_5.delete_empty_subfields(record)
+    marc_utils_5.mark_modified(record, "benchmark")
+    marc_utils_5.is_modified(record)
+    marc_utils_5.untrack_changes(record)
+
+def __records_as_text(records:List[pymarc.record.Record]) -> str:
+    file = io.StringIO()
+    marc_utils_5.write_records_as_string(file, records, leader=True)
+    return file.getvalue()
+
+def __fields_as_lines(record:pymarc.record.Record) -> List[str]:
+    return [marc_utils_5.field_as_string(field) for field in record.fields]
+
+__SORT_995 = ["b", "c", "f", "k", "*", "r"]
+__PLAN = [
+    ("sort_subfields_for_tag", "995", __SORT_995),
+    ("force_indicators", "200", "1", " "),
+    ("delete_empty_subfields",),
+    ("fix_7XX",),
+    ("split_merged_tags", "995"),
+    ("delete_multiple_subfield_for_tag", "200", "e")
+]
+
+def get_marc_utils_5_cases() -> List[Case]:
+    """Returns the cases of every public function of marc_utils_5"""
+    mu = marc_utils_5
+    sort_spec = mu.SortSpec(__SORT_995)
+    sort_profile = mu.SortProfile({"995": __SORT_995, "200": ["a", "f", "e"]})
+    plan = mu.TransformPlan(__PLAN)
+    # One rule per record like record-specific fixes, plus a few general ones
+    rules = mu.RuleSet([(("control_number", f"{index:09d}"), [("force_indicators", "200", "2")]) for index in range(10000)])
+    rules.add([("has_tag", "995"), ("leader", 6, "a")], ("delete_subfields", "995", ["r"]))
+    rules.add(("subfield_match", "214", "d", r"^©"), ("edit_repeatable_subf_content_with_regexp_for_tag", "214", ["d"], r"^©", ""))
+    rules.compile()
+    pool = mu.InternPool()
+    substitutions = mu.SubstitutionTable([("200", ["a", "e"], r"\s+", " "), ("200", ["a", "e"], r"^\s+|\s+$", ""),
+        ("214", ["d"], r"^©", ""), ("330", ["a"], r"\.\.+", "."), ("995", ["b", "c"], r"^\s+$", "")])
+    families = mu.TagFamilyNormalizer([mu.UNIMARC_7XX_FAMILY, mu.UNIMARC_72X_FAMILY])
+    table = mu.FieldDispatchTable()
+    table.add("200", lambda field: mu.filter_subfields(field, lambda subf: subf.code != "f") >= 0)
+    table.add(None, lambda field: field.is_control_field() or field.subfields != [])
+    cases = [
+        Case("marc_utils_5", "compile_pattern", lambda record: mu.compile_pattern(r"^\s+|\s+$")),
+        Case("marc_utils_5", "PatternCache", lambda record: mu.PatternCache().get(r"^[A-Z]")),
+        Case("marc_utils_5", "track_changes", __track_changes),
+        Case("marc_utils_5", "get_field_snapshot", __for_fields(mu.get_field_snapshot)),
+        Case("marc_utils_5", "get_record_snapshot", mu.get_record_snapshot),
+        Case("marc_utils_5", "get_code_view", __for_fields(lambda field: mu.get_code_view(field).has("a"), "995")),
+        Case("marc_utils_5", "IndexedRecord", __indexed_record),
+        Case("marc_utils_5", "set_field_tag", __set_field_tag),
+        Case("marc_utils_5", "LazyRecord", __lazy_record, prepare=lambda record: record.as_marc()),
+        Case("marc_utils_5", "SubstitutionTable", substitutions.apply),
+        Case("marc_utils_5", "TagFamilyNormalizer", families.apply),
+        Case("marc_utils_5", "compact_record", lambda record: mu.compact_record(record, pool)),
+        Case("marc_utils_5", "expand_record", mu.expand_record, prepare=__compacted),
+        Case("marc_utils_5", "FieldMutationBatch", __mutation_batch),
+        Case("marc_utils_5", "get_years_in_specific_subfield", lambda record: mu.get_years_in_specific_subfield(record, "214", "d")),
+        Case("marc_utils_5", "get_year_from_UNM_100", lambda record: mu.get_year_from_UNM_100(record)),
+        Case("marc_utils_5", "get_years_less_accurate", lambda record: mu.get_years_less_accurate(record, "330")),
+        Case("marc_utils_5", "get_years", lambda record: mu.get_years(record, [("214", "d"), ("330", None), ("200", None)])),
+        Case("marc_utils_5", "get_years_bulk", lambda records: mu.get_years_bulk(records, [("214", "d"), ("330", None)]), bulk=True),
+        Case("marc_utils_5", "sort_fields_by_tag", mu.sort_fields_by_tag),
+        Case("marc_utils_5", "SortSpec", __for_fields(lambda field: sort_spec.apply(field.subfields), "995")),
+        Case("marc_utils_5", "SortProfile", sort_profile.apply),
+        Case("marc_utils_5", "sort_subfields_for_tag", lambda record: mu.sort_subfields_for_tag(record, "995", __SORT_995)),
+        Case("marc_utils_5", "force_indicators", lambda record: mu.force_indicators(record, "200", "1", " ")),
+        Case("marc_utils_5", "add_missing_subfield_to_field", lambda record: mu.add_missing_subfield_to_field(record, "995", "o", "0")),
+        Case("marc_utils_5", "edit_specific_repeatable_subfield_content_with_regexp", __for_fields(lambda field: mu.edit_specific_repeatable_subfield_content_with_regexp(field, ["a"], r"^\s+|\s+$", ""), "606")),
+        Case("marc_utils_5", "edit_repeatable_subf_content_with_regexp_for_tag", lambda record: mu.edit_repeatable_subf_content_with_regexp_for_tag(record, "606", ["a"], r"^\s+|\s+$", "")),
+        Case("marc_utils_5", "replace_specific_repeatable_subfield_content_not_matching_regexp", __for_fields(lambda field: mu.replace_specific_repeatable_subfield_content_not_matching_regexp(field, ["k"], r"^A", "DEFAULT"), "995")),
+        Case("marc_utils_5", "replace_repeatable_subf_content_not_matching_regexp_for_tag", lambda record: mu.replace_repeatable_subf_content_not_matching_regexp_for_tag(record, "995", ["k"], r"^A", "DEFAULT")),
+        Case("marc_utils_5", "fix_7XX", mu.fix_7XX),
+        Case("marc_utils_5", "merge_all_fields_by_tag", lambda record: mu.merge_all_fields_by_tag(record, "995")),
+        Case("marc_utils_5", "merge_fields_by_key", lambda record: mu.merge_fields_by_key(record, ["995", "463"], ["b", "v"], ["f", "*", "r"])),
+        Case("marc_utils_5", "merge_all_subfields_with_code", lambda record: mu.merge_all_subfields_with_code(record, "606", "a", " -- ")),
+        Case("marc_utils_5", "split_tags_if_multiple_specific_subfield", lambda record: mu.split_tags_if_multiple_specific_subfield(record, "463", "t")),
+        Case("marc_utils_5", "split_merged_tags", lambda record: mu.split_merged_tags(record, "995")),
+        Case("marc_utils_5", "filter_fields", lambda record: mu.filter_fields(record, lambda field: field.tag != "610")),
+        Case("marc_utils_5", "filter_subfields", __for_fields(lambda field: mu.filter_subfields(field, lambda subf: subf.code != "2"))),
+        Case("marc_utils_5", "delete_empty_subfields", mu.delete_empty_subfields),
+        Case("marc_utils_5", "delete_empty_fields", mu.delete_empty_fields),
+        Case("marc_utils_5", "delete_field_if_all_subfields_match_regexp", lambda record: mu.delete_field_if_all_subfields_match_regexp(record, "610", "a", r"^[A-L]")),
+        Case("marc_utils_5", "delete_multiple_subfield_for_tag", lambda record: mu.delete_multiple_subfield_for_tag(record, "200", "e")),
+        Case("marc_utils_5", "delete_all_subfields_with_code_from_field", lambda record: mu.delete_all_subfields_with_code_from_field(record, "995", "r")),
+        Case("marc_utils_5", "delete_subfields", lambda record: mu.delete_subfields(record, "995", ["r", "k"])),
+        Case("marc_utils_5", "dedupe_fields", lambda record: mu.dedupe_fields(record, casefold=True, strip=True)),
+        Case("marc_utils_5", "dedupe_subfields", lambda record: mu.dedupe_subfields(record, "995", ["b", "c"])),
+        Case("marc_utils_5", "FieldDispatchTable", table.apply),
+        Case("marc_utils_5", "TransformPlan", plan),
+        Case("marc_utils_5", "get_rule_context", mu.get_rule_context),
+        Case("marc_utils_5", "RuleSet", rules),
+        Case("marc_utils_5", "field_as_string", __for_fields(mu.field_as_string)),
+        Case("marc_utils_5", "record_as_string", mu.record_as_string),
+        Case("marc_utils_5", "write_records_as_string", lambda records: mu.write_records_as_string(io.StringIO(), records, leader=True), bulk=True),
+        Case("marc_utils_5", "field_from_string", lambda lines: [mu.field_from_string(line) for line in lines], prepare=__fields_as_lines),
+        Case("marc_utils_5", "read_records_as_string", lambda text: sum(1 for _ in mu.read_records_as_string(io.StringIO(text))), bulk=True, prepare=__records_as_text)
+    ]
+    return cases
+
+def get_marc_utils_4_cases() -> List[Case]:
+    """Returns the cases of the marc_utils_4 equivalents (they need pymarc < 5)"""
+    mu = importlib.import_module("marc_utils_4")
+    return [
+        Case("marc_utils_4", "sort_fields_by_tag", mu.sort_fields_by_tag),
+        Case("marc_utils_4", "sort_subfields_for_tag", lambda record: mu.sort_subfields_for_tag(record, "995", __SORT_995)),
+        Case("marc_utils_4", "force_indicators", lambda record: mu.force_indicators(record, "200", ["1", " "])),
+        Case("marc_utils_4", "add_missing_subfield_to_field", lambda record: mu.add_missing_subfield_to_field(record, "995", "o", "0")),
+        Case("marc_utils_4", "edit_specific_repeatable_subfield_content_with_regexp", __for_fields(lambda field: mu.edit_specific_repeatable_subfield_content_with_regexp(field, ["a"], r"^\s+|\s+$", ""), "606")),
+        Case("marc_utils_4", "replace_specific_repeatable_subfield_content_not_matching_regexp", __for_fields(lambda field: mu.replace_specific_repeatable_subfield_content_not_matching_regexp(field, ["k"], r"^A", "DEFAULT"), "995")),
+        Case("marc_utils_4", "merge_all_fields_by_tag", lambda record: mu.merge_all_fields_by_tag(record, "995")),
+        Case("marc_utils_4", "split_tags_if_multiple_specific_subfield", lambda record: mu.split_tags_if_multiple_specific_subfield(record, "463", "t")),
+        Case("marc_utils_4", "split_merged_tags", lambda record: mu.split_merged_tags(record, "995")),
+        Case("marc_utils_4", "delete_empty_subfields", mu.delete_empty_subfields),
+        Case("marc_utils_4", "delete_empty_fields", mu.delete_empty_fields),
+        Case("marc_utils_4", "delete_field_if_all_subfields_match_regexp", lambda record: mu.delete_field_if_all_subfields_match_regexp(record, "610", "a", r"^[A-L]")),
+        Case("marc_utils_4", "delete_multiple_subfield_for_tag", lambda record: mu.delete_multiple_subfield_for_tag(record, "200", "e"))
+    ]
+
+def get_not_benchmarked(cases:List[Case]) -> List[str]:
+    """Returns the public functions & classes of marc_utils_5 without a case (and not in NOT_BENCHMARKED)"""
+    names = set(case.name for case in cases if case.module == "marc_utils_5")
+    output = []
+    for name, obj in inspect.getmembers(marc_utils_5, lambda obj: inspect.isfunction(obj) or inspect.isclass(obj)):
+        if name.startswith("_") or obj.__module__ != "marc_utils_5" or name in NOT_BENCHMARKED:
+            continue
+        if not name in names and name != "YearsColumns" and name != "SubfieldCodeView":
+            output.append(name)
+    return output
+
+# ------------------------------ Measures ------------------------------
+
+def __percentile(sorted_values:List[float], percent:float) -> float:
+    """Returns the percentile (nearest rank) of a sorted list"""
+    if len(sorted_values) == 0:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, math.ceil(percent / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def __check_percentile():
+    """Checks __percentile() against known nearest ranks, raises AssertionError if one is wrong"""
+    known = [
+        (list(range(1, 11)), 50, 5), (list(range(1, 11)), 90, 9), (list(range(1, 11)), 99, 10),
+        (list(range(1, 101)), 50, 50), (list(range(1, 101)), 90, 90), (list(range(1, 101)), 99, 99),
+        (list(range(1, 101)), 100, 100), (list(range(1, 101)), 0, 1), ([7], 99, 7), ([1, 2], 50, 1)
+    ]
+    for values, percent, expected in known:
+        result = __percentile(values, percent)
+        assert result == expected, f"p{percent} of {len(values)} values is {result} instead of {expected}"
+
+def run_case(case:Case, raws:List[bytes], memory:bool=True) -> dict:
+    """Benchmarks a case on freshly parsed records and returns the result as a dict.
+    Times are measured without tracemalloc, peak memory in a second run"""
+    result = {"module": case.module, "function": case.name, "records": len(raws), "status": "ok"}
+    try:
+        # Timing run
+        args = __prepare_args(case, parse_raw_records(raws))
+        latencies = []
+        start = time.perf_counter()
+        for arg in args:
+            call_start = time.perf_counter_ns()
+            case.func(arg)
+            latencies.append(time.perf_counter_ns() - call_start)
+        total = time.perf_counter() - start
+
+        # Memory run
+        peak = None
+        if memory:
+            args = __prepare_args(case, parse_raw_records(raws))
+            tracemalloc.start()
+            base, _ = tracemalloc.get_traced_memory()
+            for arg in args:
+                case.func(arg)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            peak = peak - base
+    except Exception as error:
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        result["status"] = f"error : {type(error).__name__} : {error}"
+        return result
+
+    latencies.sort()
+    result["calls"] = len(latencies)
+    result["total_s"] = total
+    result["records_per_s"] = len(raws) / total if total > 0 else None
+    result["latency_us"] = {
+        "p50": __percentile(latencies, 50) / 1000,
+        "p90": __percentile(latencies, 90) / 1000,
+        "p99": __percentile(latencies, 99) / 1000,
+        "max": latencies[-1] / 1000 if latencies else 0.0
+    }
+    result["peak_memory_kb"] = peak / 1024 if peak is not None else None
+    return result
+
+def __prepare_args(case:Case, records:List[pymarc.record.Record]) -> list:
+    """Returns the list of arguments given to the case function"""
+    if case.bulk:
+        return [case.prepare(records) if case.prepare else records]
+    if case.prepare:
+        return [case.prepare(record) for record in records]
+    return records
+
+def get_pymarc_version() -> str|None:
+    try:
+        return importlib.metadata.version("pymarc")
+    except importlib.metadata.PackageNotFoundError:
+        return None
+
+def run_benchmark(scales:List[int], seed:int=0, settings:dict=DEFAULT_SETTINGS, modules:List[str]=["marc_utils_5", "marc_utils_4"], functions:List[str]|None=None, memory:bool=True, log=sys.stderr) -> dict:
+    """Runs every case at every scale and returns the results as a JSON serializable dict.
+    marc_utils_4 cases are skipped if pymarc 5 or more is installed
+
+    Takes as argument :
+        - scales : list of numbers of records (int)
+        - [OPTIONNAL, 0] seed {int} : seed of the synthetic records
+        - [OPTIONNAL] settings {dict} : settings of generate_raw_record()
+        - [OPTIONNAL, both] modules : list of modules to benchmark
+        - [OPTIONNAL, None] functions : list of function names to benchmark, None for all
+        - [OPTIONNAL, True] memory {bool} : measure the peak memory
+        - [OPTIONNAL, stderr] log : file to write the progress in, None to write nothing"""
+    __check_percentile()
+    pymarc_version = get_pymarc_version()
+    cases = []
+    skipped = []
+    if "marc_utils_5" in modules:
+        cases += get_marc_utils_5_cases()
+    if "marc_utils_4" in modules:
+        # marc_utils_4 uses the pymarc 4 subfields list
+        if pymarc_version is not None and int(pymarc_version.split(".")[0]) >= 5:
+            skipped.append({"module": "marc_utils_4", "reason": f"needs pymarc < 5, found {pymarc_version}"})
+        else:
+            cases += get_marc_utils_4_cases()
+    not_benchmarked = get_not_benchmarked(cases) if "marc_utils_5" in modules else []
+    if functions is not None:
+        cases = [case for case in cases if case.name in functions]
+
+    results = []
+    for scale in scales:
+        raws = generate_raw_records(scale, seed, **settings)
+        for case in cases:
+            result = run_case(case, raws, memory)
+            results.append(result)
+            if log is not None:
+                if result["status"] == "ok":
+                    log.write(f"{scale:>8} {case.module:<13} {case.name:<66} {result['records_per_s']:>12.0f} rec/s  p50 {result['latency_us']['p50']:>9.1f} µs\n")
+                else:
+                    log.write(f"{scale:>8} {case.module:<13} {case.name:<66} {result['status']}\n")
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "pymarc": pymarc_version,
+            "seed": seed,
+            "settings": settings,
+            "scales": scales,
+            "skipped": skipped,
+            "not_benchmarked": not_benchmarked
+        },
+        "results": results
+    }
+
+def compare_results(baseline:dict, current:dict, threshold:float=0.2) -> List[dict]:
+    """Returns the list of regressions : cases (same module, function & number of records)
+    whose records/s dropped by more than threshold (0.2 = 20 %) compared to the baseline"""
+    baseline_results = {}
+    for result in baseline["results"]:
+        if result["status"] == "ok":
+            baseline_results[(result["module"], result["function"], result["records"])] = result
+    regressions = []
+    for result in current["results"]:
+        old = baseline_results.get((result["module"], result["function"], result["records"]))
+        if old is None or result["status"] != "ok":
+            continue
+        ratio = result["records_per_s"] / old["records_per_s"]
+        if ratio < 1 - threshold:
+            regressions.append({"module": result["module"], "function": result["function"], "records": result["records"],
+                "baseline_records_per_s": old["records_per_s"], "records_per_s": result["records_per_s"], "ratio": ratio})
+    return regressions
+
+# ------------------------------ Main ------------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks marc_utils_5 (and marc_utils_4) functions on synthetic UNIMARC records")
+    parser.add_argument("--scales", default="100,1000", help="comma separated numbers of records (default : 100,1000)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--fields", type=int, default=DEFAULT_SETTINGS["nb_fields"], help="minimum number of fields per record")
+    parser.add_argument("--995", dest="nb_995", type=int, default=DEFAULT_SETTINGS["nb_995"], help="number of 995 per record")
+    parser.add_argument("--7xx", dest="nb_7XX", type=int, default=DEFAULT_SETTINGS["nb_7XX"], help="number of 7XX per record")
+    parser.add_argument("--463", dest="nb_463", type=int, default=DEFAULT_SETTINGS["nb_463"], help="number of 463 per record")
+    parser.add_argument("--subfield-repeat", type=int, default=DEFAULT_SETTINGS["subfield_repeat"], help="occurrences of repeatable subfields")
+    parser.add_argument("--modules", default="marc_utils_5,marc_utils_4", help="comma separated modules to benchmark")
+    parser.add_argument("--functions", default=None, help="comma separated function names to benchmark (default : all)")
+    parser.add_argument("--no-memory", action="store_true", help="do not measure the peak memory")
+    parser.add_argument("--output", default=None, help="JSON file to write the results in (default : stdout)")
+    parser.add_argument("--compare", default=None, help="JSON results of a previous run, exits with 1 if a case got slower than --threshold")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed records/s drop when comparing (default : 0.2)")
+    parser.add_argument("--write-corpus", default=None, help="only writes the synthetic records of the first scale in this ISO 2709 file")
+    args = parser.parse_args()
+
+    settings = {"nb_fields": args.fields, "nb_995": args.nb_995, "nb_7XX": args.nb_7XX, "nb_463": args.nb_463, "subfield_repeat": args.subfield_repeat}
+    scales = [int(scale) for scale in args.scales.split(",")]
+
+    if args.write_corpus:
+        write_corpus(args.write_corpus, scales[0], args.seed, **settings)
+        sys.exit(0)
+
+    results = run_benchmark(scales, args.seed, settings, args.modules.split(","),
+        args.functions.split(",") if args.functions else None, not args.no_memory)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as file:
+            regressions = compare_results(json.load(file), results, args.threshold)
+        for regression in regressions:
+            sys.stderr.write(f"REGRESSION {regression['module']} {regression['function']} ({regression['records']} records) : {regression['ratio']:.2f}x\n")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,865 @@
+# -*- coding: utf-8 -*-
+
+import pymarc
+from typing import List, Tuple, Iterator, Iterable, Callable, BinaryIO
+import io
+import json
+import os
+import mmap
+import struct
+import zlib
+import array
+import multiprocessing
+import marc_utils_5
+
+RECORD_TERMINATOR = b"\x1d"
+FIELD_TERMINATOR = b"\x1e"
+LEADER_LENGTH = 24
+DIRECTORY_ENTRY_LENGTH = 12
+
+# ------------------------------ Raw records ------------------------------
+
+def iter_raw_records(file:BinaryIO, buffer_size:int=1024*1024) -> Iterator[bytes]:
+    """Yields every raw record (ISO 2709 bytes, terminator included) of an opened binary file,
+    splitting on the record terminator (0x1D) without parsing anything.
+    If the file does not end with a terminator, the remaining bytes are yielded as the last record
+
+    Takes as argument :
+        - file : the file opened in binary mode
+        - [OPTIONNAL, 1 Mo] buffer_size {int} : the number of bytes read at once"""
+    rest = b""
+    while True:
+        block = file.read(buffer_size)
+        if not block:
+            break
+        block = rest + block
+        start = 0
+        end = block.find(RECORD_TERMINATOR, start)
+        while end != -1:
+            yield block[start:end+1]
+            start = end + 1
+            end = block.find(RECORD_TERMINATOR, start)
+        rest = block[start:]
+    if rest:
+        yield rest
+
+def iter_raw_chunks(file:BinaryIO, chunk_size:int=1000, buffer_size:int=1024*1024) -> Iterator[List[bytes]]:
+    """Yields lists of at most chunk_size raw records (see iter_raw_records())
+
+    Takes as argument :
+        - file : the file opened in binary mode
+        - [OPTIONNAL, 1000] chunk_size {int} : the number of records per chunk
+        - [OPTIONNAL, 1 Mo] buffer_size {int} : the number of bytes read at once"""
+    chunk = []
+    for raw in iter_raw_records(file, buffer_size):
+        chunk.append(raw)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def parse_raw_record(raw:bytes, to_unicode:bool=True, force_utf8:bool=True, lazy:bool=False) -> pymarc.record.Record|None:
+    """Returns the pymarc record of a raw record, or None if it is invalid (like pymarc MARCReader)
+
+    Takes as argument :
+        - raw {bytes} : the ISO 2709 record
+        - [OPTIONNAL, True] to_unicode {bool} : same as pymarc MARCReader
+        - [OPTIONNAL, True] force_utf8 {bool} : same as pymarc MARCReader
+        - [OPTIONNAL, False] lazy {bool} : returns a marc_utils_5.LazyRecord, fields are only decoded
+    when they are used (so decoding errors are raised when the field is used)"""
+    if lazy:
+        if raw[-1:] != RECORD_TERMINATOR:
+            return None
+        try:
+            return marc_utils_5.LazyRecord(raw, to_unicode=to_unicode, force_utf8=force_utf8)
+        except Exception:
+            return None
+    reader = pymarc.MARCReader(io.BytesIO(raw), to_unicode=to_unicode, force_utf8=force_utf8)
+    return next(reader, None)
+
+# ------------------------------ Prefilter ------------------------------
+
+def __get_raw_directory_end(raw:bytes) -> int|None:
+    """Returns the position of the field terminator ending the directory, None if it's not valid"""
+    # Base address of data is at leader positions 12-16
+    base_address = raw[12:17]
+    if base_address.isdigit() and LEADER_LENGTH < int(base_address) <= len(raw):
+        directory_end = int(base_address) - 1
+    else:
+        directory_end = raw.find(FIELD_TERMINATOR, LEADER_LENGTH)
+    if directory_end < LEADER_LENGTH or (directory_end - LEADER_LENGTH) % DIRECTORY_ENTRY_LENGTH != 0:
+        return None
+    return directory_end
+
+def get_raw_record_tags(raw:bytes) -> List[str]|None:
+    """Returns the tags of a raw record (in directory order) only reading the leader and the directory.
+    Returns None if the directory can't be read
+
+    Takes as argument :
+        - raw {bytes} : the ISO 2709 record"""
+    directory_end = __get_raw_directory_end(raw)
+    if directory_end is None:
+        return None
+    try:
+        return [raw[index:index+3].decode("ascii") for index in range(LEADER_LENGTH, directory_end, DIRECTORY_ENTRY_LENGTH)]
+    except UnicodeDecodeError:
+        return None
+
+class TagFilter:
+    """Checks if tags are matching a list of tags.
+    In the list, a tag can use X as a wildcard (e.g. "7XX" or "9X5")
+
+    Takes as argument :
+        - tags : list of tags (str)"""
+
+    def __init__(self, tags:Iterable[str]):
+        self.tags = set()
+        self.patterns = []
+        for tag in tags:
+            if "X" in tag.upper():
+                self.patterns.append(tag.upper())
+            else:
+                self.tags.add(tag)
+
+    def match(self, tag:str) -> bool:
+        """Returns True if the tag matches one the tags"""
+        if tag in self.tags:
+            return True
+        for pattern in self.patterns:
+            if len(pattern) == len(tag) and all(char == "X" or char == tag_char for char, tag_char in zip(pattern, tag)):
+                return True
+        return False
+
+    def match_any(self, tags:Iterable[str]) -> bool:
+        """Returns True if one of the tags matches"""
+        for tag in tags:
+            if self.match(tag):
+                return True
+        return False
+
+def get_raw_control_field(raw:bytes, tag:str="001") -> str|None:
+    """Returns the data of the first control field with this tag of a raw record, only reading the leader,
+    the directory and this field.
+    Returns None if the record has no such field or if the directory can't be read
+
+    Takes as argument :
+        - raw {bytes} : the ISO 2709 record
+        - [OPTIONNAL, "001"] tag {str}"""
+    directory_end = __get_raw_directory_end(raw)
+    if directory_end is None:
+        return None
+    encoded_tag = tag.encode("ascii")
+    for index in range(LEADER_LENGTH, directory_end, DIRECTORY_ENTRY_LENGTH):
+        if raw[index:index+3] != encoded_tag:
+            continue
+        length = raw[index+3:index+7]
+        start = raw[index+7:index+12]
+        if not length.isdigit() or not start.isdigit():
+            return None
+        start = directory_end + 1 + int(start)
+        data = raw[start:start+int(length)]
+        return data.rstrip(FIELD_TERMINATOR).decode("utf-8", errors="replace")
+    return None
+
+def raw_record_has_tags(raw:bytes, tag_filter:TagFilter) -> bool:
+    """Returns True if the raw record has at least one field matching the filter,
+    or if its directory can't be read (so the record goes through the usual parsing)
+
+    Takes as argument :
+        - raw {bytes} : the ISO 2709 record
+        - tag_filter {TagFilter}"""
+    tags = get_raw_record_tags(raw)
+    if tags is None:
+        return True
+    return tag_filter.match_any(tags)
+
+# ------------------------------ Tolerant reader ------------------------------
+
+def validate_raw_record(raw:bytes) -> Tuple[str, str]|None:
+    """Checks the leader & the directory of a raw record against its real length (the position of
+    its record terminator) without decoding it.
+    Returns None if the record is valid, else a tuple (error type, message), error types being
+    "truncated", "record_length", "base_address", "directory" & "field"
+
+    Takes as argument :
+        - raw {bytes} : the ISO 2709 record, terminator included"""
+    if len(raw) == 0 or raw[-1:] != RECORD_TERMINATOR:
+        return "truncated", "No record terminator"
+    if len(raw) < LEADER_LENGTH + 2:
+        return "truncated", f"Record too short ({len(raw)} bytes)"
+    # Record length is at leader positions 0-4
+    record_length = raw[0:5]
+    if not record_length.isdigit() or int(record_length) != len(raw):
+        return "record_length", f"Leader record length {record_length!r} does not match the record length {len(raw)}"
+    base_address = raw[12:17]
+    if not base_address.isdigit() or not LEADER_LENGTH < int(base_address) <= len(raw) - 1:
+        return "base_address", f"Invalid base address of data {base_address!r}"
+    base_address = int(base_address)
+    directory_end = base_address - 1
+    if raw[directory_end:base_address] != FIELD_TERMINATOR or (directory_end - LEADER_LENGTH) % DIRECTORY_ENTRY_LENGTH != 0:
+        return "directory", f"Directory does not end at the base address of data {base_address}"
+    data_length = len(raw) - 1 - base_address
+    for index in range(LEADER_LENGTH, directory_end, DIRECTORY_ENTRY_LENGTH):
+        entry = raw[index:index+DIRECTORY_ENTRY_LENGTH]
+        length = entry[3:7]
+        start = entry[7:12]
+        if not length.isdigit() or not start.isdigit():
+            return "directory", f"Invalid directory entry {entry!r}"
+        end = int(start) + int(length)
+        if int(length) == 0 or end > data_length:
+            return "field", f"Field {entry[:3]!r} goes past the end of the record"
+        if raw[base_address+end-1:base_address+end] != FIELD_TERMINATOR:
+            return "field", f"Field {entry[:3]!r} does not end with a field terminator"
+    return None
+
+class TolerantMARCReader:
+    """Reads the records of an ISO 2709 file, splitting on the record terminator (0x1D) so a broken
+    record never desynchronizes the next ones.
+    Each record is checked (see validate_raw_record()) before being parsed, and rejected records are
+    written as their original bytes in a quarantine file, with one JSON line per error in an error log.
+    Only valid records are yielded.
+    Use it as a context manager or call close()
+
+    Takes as argument :
+        - file : the file opened in binary mode (or its path)
+        - [OPTIONNAL, None] quarantine_file : ISO 2709 file (or its path) where rejected records are written
+        - [OPTIONNAL, None] error_log_file : text file (or its path) where errors are written as JSON lines
+        - [OPTIONNAL, True] to_unicode {bool} : same as pymarc MARCReader
+        - [OPTIONNAL, True] force_utf8 {bool} : same as pymarc MARCReader
+        - [OPTIONNAL, 1 Mo] buffer_size {int} : the number of bytes read at once"""
+
+    def __init__(self, file, quarantine_file=None, error_log_file=None, to_unicode:bool=True, force_utf8:bool=True, buffer_size:int=1024*1024):
+        self._opened = []
+        if isinstance(file, str):
+            file = open(file, "rb")
+            self._opened.append(file)
+        if isinstance(quarantine_file, str):
+            quarantine_file = open(quarantine_file, "wb")
+            self._opened.append(quarantine_file)
+        if isinstance(error_log_file, str):
+            error_log_file = open(error_log_file, "w", encoding="utf-8")
+            self._opened.append(error_log_file)
+        self.file = file
+        self.quarantine_file = quarantine_file
+        self.error_log_file = error_log_file
+        self.to_unicode = to_unicode
+        self.force_utf8 = force_utf8
+        self.buffer_size = buffer_size
+        # Counters
+        self.records = 0
+        self.errors = 0
+        self.error_types = {}
+        self.quarantined_bytes = 0
+        self.offset = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Closes the files opened by the reader"""
+        for file in self._opened:
+            file.close()
+        self._opened = []
+
+    def stats(self) -> dict:
+        """Returns the counters : valid records, errors, errors by type, quarantined bytes & bytes read"""
+        return {"records": self.records, "errors": self.errors, "error_types": dict(self.error_types),
+            "quarantined_bytes": self.quarantined_bytes, "offset": self.offset}
+
+    def _reject(self, raw:bytes, position:int, error_type:str, message:str):
+        self.errors += 1
+        self.error_types[error_type] = self.error_types.get(error_type, 0) + 1
+        self.quarantined_bytes += len(raw)
+        if self.quarantine_file is not None:
+            self.quarantine_file.write(raw)
+        if self.error_log_file is not None:
+            self.error_log_file.write(json.dumps({
+                "position": position,
+                "offset": self.offset,
+                "length": len(raw),
+                "type": error_type,
+                "error": message,
+                "control_number": get_raw_control_field(raw) if error_type != "truncated" else None
+            }, ensure_ascii=False) + "\n")
+
+    def __iter__(self) -> Iterator[pymarc.record.Record]:
+        for position, raw in enumerate(iter_raw_records(self.file, self.buffer_size)):
+            error = validate_raw_record(raw)
+            record = None
+            if error is None:
+                try:
+                    record = pymarc.record.Record(raw, to_unicode=self.to_unicode, force_utf8=self.force_utf8)
+                except Exception as exc:
+                    error = ("parse", f"{type(exc).__name__} : {exc}")
+            if error is not None:
+                self._reject(raw, position, *error)
+            else:
+                self.records += 1
+            self.offset += len(raw)
+            if record is not None:
+                yield record
+
+# ------------------------------ Workers ------------------------------
+
+# Set in every worker by __init_worker()
+__WORKER_SETTINGS = {}
+
+def __init_worker(transform:Callable, to_unicode:bool, force_utf8:bool, tag_filter:TagFilter|None=None, keep_unmodified_bytes:bool=False, instrument:bool=False, lazy:bool=False, count_changes:bool=False):
+    __WORKER_SETTINGS["transform"] = transform
+    __WORKER_SETTINGS["to_unicode"] = to_unicode
+    __WORKER_SETTINGS["force_utf8"] = force_utf8
+    __WORKER_SETTINGS["tag_filter"] = tag_filter
+    __WORKER_SETTINGS["keep_unmodified_bytes"] = keep_unmodified_bytes
+    __WORKER_SETTINGS["instrument"] = instrument
+    __WORKER_SETTINGS["lazy"] = lazy
+    __WORKER_SETTINGS["count_changes"] = count_changes
+    if instrument:
+        marc_utils_5.enable_instrumentation()
+        marc_utils_5.reset_instrumentation()
+
+def __transform_raw_record(raw:bytes, transform:Callable, to_unicode:bool, force_utf8:bool, keep_unmodified_bytes:bool=False, lazy:bool=False, count_changes:bool=False) -> Tuple[bytes|None, dict]:
+    """Returns the transformed record as ISO 2709 bytes (None if the record is invalid)
+    and the changes made by the transform (see marc_utils_5.get_changes(), empty if not count_changes).
+    If keep_unmodified_bytes, records with the same snapshot before and after the transform
+    (see marc_utils_5.get_record_snapshot()) are returned as their original bytes.
+    If lazy, a field that can't be decoded makes the record invalid, like when it is not lazy"""
+    record = parse_raw_record(raw, to_unicode, force_utf8, lazy)
+    if record is None:
+        return None, {}
+    if not lazy:
+        return __transform_record(raw, record, transform, keep_unmodified_bytes, count_changes)
+    # Lazy fields are decoded by the transform or when written
+    try:
+        return __transform_record(raw, record, transform, keep_unmodified_bytes, count_changes)
+    except UnicodeDecodeError:
+        return None, {}
+
+def __transform_record(raw:bytes, record:pymarc.record.Record, transform:Callable, keep_unmodified_bytes:bool, count_changes:bool) -> Tuple[bytes, dict]:
+    """Returns the record transformed as ISO 2709 bytes and the changes made by the transform
+    (see __transform_raw_record())"""
+    before = None
+    if keep_unmodified_bytes:
+        before = marc_utils_5.get_record_snapshot(record)
+    # Tracking is only used to count changes (TransformPlan is slower on tracked records)
+    if count_changes:
+        marc_utils_5.track_changes(record)
+    try:
+        output = transform(record)
+    finally:
+        changes = marc_utils_5.untrack_changes(record)
+    # The transform can return a new record, else the edited one is used
+    if isinstance(output, pymarc.record.Record) and output is not record:
+        record = output
+        if count_changes:
+            changes["transform"] = changes.get("transform", 0) + 1
+    if before is not None and marc_utils_5.get_record_snapshot(record) == before:
+        return raw, changes
+    return record.as_marc(), changes
+
+def __process_chunk(chunk:List[bytes]) -> Tuple[bytes, int, int, int, int, dict, dict|None]:
+    """Transforms every record in the chunk, returns the output bytes,
+    the number of records written, the number of invalid records,
+    the number of records written without parsing, the number of modified records,
+    for each operation, the number of records it modified
+    and the instrumentation counters of the chunk (None if not instrumented)"""
+    output = []
+    errors = 0
+    passed = 0
+    modified = 0
+    operations = {}
+    tag_filter = __WORKER_SETTINGS["tag_filter"]
+    for raw in chunk:
+        # No field is targeted, keep the original bytes
+        if tag_filter is not None and not raw_record_has_tags(raw, tag_filter):
+            output.append(raw)
+            passed += 1
+            continue
+        transformed, changes = __transform_raw_record(raw, __WORKER_SETTINGS["transform"], __WORKER_SETTINGS["to_unicode"], __WORKER_SETTINGS["force_utf8"], __WORKER_SETTINGS["keep_unmodified_bytes"], __WORKER_SETTINGS["lazy"], __WORKER_SETTINGS["count_changes"])
+        if transformed is None:
+            errors += 1
+            continue
+        output.append(transformed)
+        if len(changes) > 0:
+            modified += 1
+            for operation in changes:
+                operations[operation] = operations.get(operation, 0) + 1
+    instrumentation = None
+    if __WORKER_SETTINGS["instrument"]:
+        instrumentation = marc_utils_5.get_instrumentation_snapshot()
+        marc_utils_5.reset_instrumentation()
+    return b"".join(output), len(output), errors, passed, modified, operations, instrumentation
+
+def __add_chunk_stats(stats:dict, nb_records:int, nb_errors:int, nb_passed:int, nb_modified:int, operations:dict, instrumentation:dict|None):
+    """Adds the results of a chunk to the stats of process_file()"""
+    stats["records"] += nb_records
+    stats["errors"] += nb_errors
+    stats["passed"] += nb_passed
+    stats["modified"] += nb_modified
+    for operation, nb in operations.items():
+        stats["operations"][operation] = stats["operations"].get(operation, 0) + nb
+    stats["chunks"] += 1
+    if instrumentation is not None:
+        stats["instrumentation"] = marc_utils_5.merge_instrumentation_snapshots([stats["instrumentation"], instrumentation])
+
+# ------------------------------ Batch ------------------------------
+
+def read_checkpoint(checkpoint_path:str) -> dict|None:
+    """Returns the checkpoint written by process_file(), None if the file does not exist"""
+    if not os.path.exists(checkpoint_path):
+        return None
+    with open(checkpoint_path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+def __write_checkpoint(checkpoint_path:str, checkpoint:dict):
+    """Writes the checkpoint in a temporary file then replaces the old one, so it's never half written"""
+    temp_path = checkpoint_path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as file:
+        json.dump(checkpoint, file, indent=2)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, checkpoint_path)
+
+def process_file(input_path:str, output_path:str, transform:Callable, workers:int|None=None, chunk_size:int=1000, max_in_flight_bytes:int=256*1024*1024, to_unicode:bool=True, force_utf8:bool=True, prefilter_tags:Iterable[str]|None=None, keep_unmodified_bytes:bool=False, instrument:bool=False, checkpoint_path:str|None=None, checkpoint_every:int=100, resume:bool=False, lazy:bool=False, count_changes:bool=False) -> dict:
+    """Applies transform to every record of an ISO 2709 file using a process pool and writes
+    the records in the output file in input order.
+    Invalid records are skipped (like pymarc MARCReader returning None) and counted.
+    Returns a dict with the number of records written, invalid records, records written without
+    being parsed, modified records, chunks processed & for each operation the number of records it modified.
+    Modified records & operations are only counted if count_changes
+
+    /!\\ transform must be picklable (a module level function or a marc_utils_5.TransformPlan)
+    and the script calling this must be protected by if __name__ == "__main__"
+
+    Takes as argument :
+        - input_path {str} : the ISO 2709 file to read
+        - output_path {str} : the ISO 2709 file to write
+        - transform : function taking a pymarc record and editing it (if it returns a record,
+    this record is written instead)
+        - [OPTIONNAL, cpu count] workers {int} : number of processes, 0 or 1 runs everything in this process
+        - [OPTIONNAL, 1000] chunk_size {int} : number of records sent to a worker at once
+        - [OPTIONNAL, 256 Mo] max_in_flight_bytes {int} : maximum input bytes waiting to be written
+    (being processed or in the reorder buffer)
+        - [OPTIONNAL, True] to_unicode {bool} : same as pymarc MARCReader
+        - [OPTIONNAL, True] force_utf8 {bool} : same as pymarc MARCReader
+        - [OPTIONNAL, None] prefilter_tags : list of tags (X can be used as a wildcard) used by transform.
+    Records without any of those tags in their directory are written as their original bytes,
+    without being parsed. If None and transform is a marc_utils_5 TransformPlan, SubstitutionTable
+    or TagFamilyNormalizer, its get_tags() is used (no prefilter if it returns None)
+        - [OPTIONNAL, False] keep_unmodified_bytes {bool} : records the transform did not modify are written
+    as their original bytes instead of being serialized again. Records are compared before and after
+    the transform (see marc_utils_5.get_record_snapshot()), so any edit is kept
+        - [OPTIONNAL, False] instrument {bool} : enables marc_utils_5 instrumentation in every worker,
+    the merged counters are returned in the "instrumentation" key (see marc_utils_5.get_instrumentation_snapshot())
+        - [OPTIONNAL, None] checkpoint_path {str} : JSON file where the progress (input & output offsets,
+    stats) is saved every checkpoint_every chunks, after the output is flushed to the disk
+        - [OPTIONNAL, 100] checkpoint_every {int} : number of written chunks between two checkpoints
+        - [OPTIONNAL, False] resume {bool} : if the checkpoint exists, continues from it (the output is cut
+    at the saved offset). The output is the same as an uninterrupted run if transform & options did not change.
+    Raises ValueError if the checkpoint was saved for other paths or if the input size or modification time changed
+        - [OPTIONNAL, False] lazy {bool} : records are marc_utils_5.LazyRecord, only the fields used by transform
+    are decoded and untouched fields are written as their original bytes. Records with a field that can't be decoded
+    (when transform uses it or when it is written) are invalid records
+        - [OPTIONNAL, False] count_changes {bool} : tracks the changes of every record (see marc_utils_5.track_changes())
+    to count modified records & the records modified by each operation. Only edits made by marc_utils_5 functions
+    (or marked with marc_utils_5.mark_modified()) are counted. Slower : TransformPlan compares every field
+    before and after each of its operations on tracked records"""
+
+    tag_filter = None
+    if prefilter_tags is None and isinstance(transform, (marc_utils_5.TransformPlan, marc_utils_5.SubstitutionTable, marc_utils_5.TagFamilyNormalizer)):
+        prefilter_tags = transform.get_tags()
+    if prefilter_tags is not None:
+        tag_filter = TagFilter(prefilter_tags)
+    stats = {"records": 0, "errors": 0, "passed": 0, "modified": 0, "chunks": 0, "operations": {}}
+    if instrument:
+        stats["instrumentation"] = {}
+    input_offset = 0
+    output_offset = 0
+
+    # Resumes from the checkpoint
+    checkpoint = None
+    if resume and checkpoint_path is not None:
+        checkpoint = read_checkpoint(checkpoint_path)
+    input_stat = os.stat(input_path)
+    if checkpoint is not None:
+        if checkpoint.get("input_path") != input_path or checkpoint.get("output_path") != output_path:
+            raise ValueError(f"Can't resume : {checkpoint_path} was saved for other input/output paths")
+        if checkpoint.get("input_size") != input_stat.st_size or checkpoint.get("input_mtime") != input_stat.st_mtime_ns:
+            raise ValueError(f"Can't resume : {input_path} changed since the checkpoint")
+        if os.path.getsize(output_path) < checkpoint["output_offset"]:
+            raise ValueError(f"Can't resume : {output_path} is shorter than in the checkpoint")
+        input_offset = checkpoint["input_offset"]
+        output_offset = checkpoint["output_offset"]
+        stats = checkpoint["stats"]
+        if instrument and not "instrumentation" in stats:
+            stats["instrumentation"] = {}
+        if checkpoint["complete"]:
+            return stats
+    chunks_since_checkpoint = 0
+
+    def save_checkpoint(complete:bool):
+        output_file.flush()
+        os.fsync(output_file.fileno())
+        __write_checkpoint(checkpoint_path, {
+            "input_path": input_path,
+            "output_path": output_path,
+            "input_size": input_stat.st_size,
+            "input_mtime": input_stat.st_mtime_ns,
+            "input_offset": input_offset,
+            "output_offset": output_offset,
+            "complete": complete,
+            "stats": stats
+        })
+
+    def write_chunk(output:bytes, chunk_stats:list, size:int):
+        """Writes a processed chunk and saves a checkpoint if needed"""
+        nonlocal input_offset, output_offset, chunks_since_checkpoint
+        output_file.write(output)
+        __add_chunk_stats(stats, *chunk_stats)
+        input_offset += size
+        output_offset += len(output)
+        chunks_since_checkpoint += 1
+        if checkpoint_path is not None and chunks_since_checkpoint >= checkpoint_every:
+            save_checkpoint(False)
+            chunks_since_checkpoint = 0
+
+    with open(input_path, "rb") as input_file, open(output_path, "r+b" if checkpoint is not None else "wb") as output_file:
+        if checkpoint is not None:
+            # Drops what was written after the checkpoint
+            output_file.truncate(output_offset)
+            output_file.seek(output_offset)
+            input_file.seek(input_offset)
+
+        # Runs in this process
+        if workers is not None and workers <= 1:
+            was_instrumented = marc_utils_5.is_instrumentation_enabled()
+            __init_worker(transform, to_unicode, force_utf8, tag_filter, keep_unmodified_bytes, instrument, lazy, count_changes)
+            try:
+                for chunk in iter_raw_chunks(input_file, chunk_size):
+                    output, *chunk_stats = __process_chunk(chunk)
+                    write_chunk(output, chunk_stats, sum(len(raw) for raw in chunk))
+            finally:
+                if instrument and not was_instrumented:
+                    marc_utils_5.disable_instrumentation()
+        else:
+            with multiprocessing.Pool(workers, initializer=__init_worker, initargs=(transform, to_unicode, force_utf8, tag_filter, keep_unmodified_bytes, instrument, lazy, count_changes)) as pool:
+                # Reorder buffer : chunk index -> (async result, input size)
+                pending = {}
+                next_to_write = 0
+                in_flight_bytes = 0
+
+                def write_ready_chunks(block:bool):
+                    """Writes the chunks following the last written one if they're done.
+                    If block, waits for the next one"""
+                    nonlocal next_to_write, in_flight_bytes
+                    while next_to_write in pending:
+                        result, size = pending[next_to_write]
+                        if not block and not result.ready():
+                            return
+                        output, *chunk_stats = result.get()
+                        write_chunk(output, chunk_stats, size)
+                        del pending[next_to_write]
+                        in_flight_bytes -= size
+                        next_to_write += 1
+                        block = False
+
+                for index, chunk in enumerate(iter_raw_chunks(input_file, chunk_size)):
+                    size = sum(len(raw) for raw in chunk)
+                    pending[index] = (pool.apply_async(__process_chunk, (chunk,)), size)
+                    in_flight_bytes += size
+                    write_ready_chunks(block=False)
+                    # Too much data waiting, wait for the oldest chunk
+                    while in_flight_bytes > max_in_flight_bytes and pending:
+                        write_ready_chunks(block=True)
+                # Write what's left
+                while pending:
+                    write_ready_chunks(block=True)
+
+        if checkpoint_path is not None:
+            save_checkpoint(True)
+    return stats
+
+# ------------------------------ Offset index ------------------------------
+
+# Index file : header (magic, indexed bytes, number of records, complete, number of 001, size of the 001 bytes,
+# number of buckets), the offset of every record (unsigned 64 bits int, records follow each other so the length is
+# the next offset minus this one) then, once complete, the 001 table sorted by 001 : end of each 001 in the 001 bytes,
+# position of its record, the hash table of the 001 (all unsigned 64 bits int) & the 001 bytes.
+# The hash table has a power of 2 number of buckets (at least twice the number of 001), each bucket is empty (0)
+# or the index + 1 of a 001 in the table. A 001 is in the first bucket free from crc32(001) modulo the number
+# of buckets (open addressing with linear probing)
+__INDEX_MAGIC = b"MRCIDX03"
+__INDEX_HEADER = struct.Struct("<8sQQB7xQQQ")
+__INDEX_INT_SIZE = 8
+
+def get_index_path(mrc_path:str) -> str:
+    """Returns the default path of the offset index of a file (the file path + .idx)"""
+    return mrc_path + ".idx"
+
+def read_offset_index(index_data, header_only:bool=False) -> Tuple[int, int, bool, memoryview, memoryview, memoryview, memoryview, memoryview]|Tuple[int, int, bool]:
+    """Reads an offset index without copying it (bytes or a memory-mapped index file), returns the indexed bytes,
+    the number of records, if it's complete, the offset of every record & the 001 table sorted by 001 :
+    the end of each 001 in the 001 bytes, the position of its record, the hash table buckets (index + 1 of a 001,
+    0 if empty, see get_index_bucket()) & the 001 bytes (empty if not complete).
+    Offsets & the 001 table are memoryview of unsigned 64 bits int (release them before closing a mmap).
+    Raises a ValueError if it is not an index
+
+    Takes as argument :
+        - index_data : the index (bytes, mmap...)
+        - [OPTIONNAL, False] header_only {bool} : only returns the indexed bytes, the number of records
+    & if it's complete (index_data can be the header only)"""
+    if len(index_data) < __INDEX_HEADER.size:
+        raise ValueError("Not a MARC offset index : file too short")
+    magic, indexed_bytes, nb_records, complete, nb_keys, keys_size, nb_buckets = __INDEX_HEADER.unpack_from(index_data)
+    if magic != __INDEX_MAGIC:
+        raise ValueError("Not a MARC offset index : wrong magic number")
+    if header_only:
+        return indexed_bytes, nb_records, bool(complete)
+    if not complete:
+        nb_keys, keys_size, nb_buckets = 0, 0, 0
+    data = memoryview(index_data)
+    # Only the entries the header accounts for are read, others were not flushed completely
+    offsets_end = __INDEX_HEADER.size + nb_records * __INDEX_INT_SIZE
+    key_ends_end = offsets_end + nb_keys * __INDEX_INT_SIZE
+    key_positions_end = key_ends_end + nb_keys * __INDEX_INT_SIZE
+    buckets_end = key_positions_end + nb_buckets * __INDEX_INT_SIZE
+    if len(data) < buckets_end + keys_size:
+        raise ValueError("Not a MARC offset index : file truncated")
+    return (indexed_bytes, nb_records, bool(complete), data[__INDEX_HEADER.size:offsets_end].cast("Q"),
+        data[offsets_end:key_ends_end].cast("Q"), data[key_ends_end:key_positions_end].cast("Q"),
+        data[key_positions_end:buckets_end].cast("Q"), data[buckets_end:buckets_end + keys_size])
+
+def get_index_bucket(key:bytes, nb_buckets:int) -> int:
+    """Returns the first bucket where a 001 (utf-8 bytes) is searched in the hash table of an index
+    (nb_buckets is a power of 2)"""
+    return zlib.crc32(key) & (nb_buckets - 1)
+
+def build_offset_index(mrc_path:str, index_path:str|None=None, flush_every:int=10000, rebuild:bool=False) -> int:
+    """Builds the offset index of an ISO 2709 file (offset of every record & a table of 001 sorted by 001)
+    by memory-mapping it, and returns the number of records.
+    If an incomplete index exists (e.g. the build was interrupted), indexing resumes where it stopped.
+    If the file grew since the index was completed, only the new records are indexed.
+    The 001 table (with its hash table) is written once every record is indexed
+
+    Takes as argument :
+        - mrc_path {str} : the ISO 2709 file
+        - [OPTIONNAL, mrc_path + ".idx"] index_path {str} : the index file
+        - [OPTIONNAL, 10000] flush_every {int} : number of records indexed between two saves
+        - [OPTIONNAL, False] rebuild {bool} : ignores the existing index"""
+    if index_path is None:
+        index_path = get_index_path(mrc_path)
+    size = os.path.getsize(mrc_path)
+
+    # Gets the resume point
+    indexed_bytes = 0
+    nb_records = 0
+    # 001 -> position of the records in the 001 table of a complete index
+    positions = {}
+    if not rebuild and os.path.exists(index_path):
+        try:
+            with open(index_path, "rb") as index_file:
+                # Only the header is read if the index is up to date
+                indexed_bytes, nb_records, complete = read_offset_index(index_file.read(__INDEX_HEADER.size), header_only=True)
+                if complete and indexed_bytes == size:
+                    return nb_records
+                if complete and indexed_bytes < size:
+                    index_file.seek(0)
+                    _, _, _, _, key_ends, key_positions, _, keys = read_offset_index(index_file.read())
+                    start = 0
+                    for index in range(len(key_ends)):
+                        positions[bytes(keys[start:key_ends[index]]).decode("utf-8")] = key_positions[index]
+                        start = key_ends[index]
+        except ValueError:
+            indexed_bytes, nb_records = 0, 0
+        # The file got smaller, the index is wrong
+        if indexed_bytes > size:
+            indexed_bytes, nb_records = 0, 0
+    if indexed_bytes == 0:
+        positions = {}
+        with open(index_path, "wb") as index_file:
+            index_file.write(__INDEX_HEADER.pack(__INDEX_MAGIC, 0, 0, 0, 0, 0, 0))
+    # Records indexed before an interruption are not in the 001 table
+    nb_known_records = nb_records if len(positions) > 0 else 0
+
+    with open(mrc_path, "rb") as mrc_file, open(index_path, "r+b") as index_file:
+        # Drops the 001 table & entries written after the last header update
+        index_file.seek(0)
+        index_file.write(__INDEX_HEADER.pack(__INDEX_MAGIC, indexed_bytes, nb_records, 0, 0, 0, 0))
+        index_file.truncate(__INDEX_HEADER.size + nb_records * __INDEX_INT_SIZE)
+        if size == 0:
+            index_file.seek(0)
+            index_file.write(__INDEX_HEADER.pack(__INDEX_MAGIC, 0, 0, 1, 0, 0, 0))
+            return 0
+        with mmap.mmap(mrc_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            position = indexed_bytes
+            entries = array.array("Q")
+            while position < size:
+                end = mapped.find(RECORD_TERMINATOR, position)
+                # Last record without terminator
+                if end == -1:
+                    end = size - 1
+                entries.append(position)
+                position = end + 1
+                if len(entries) >= flush_every:
+                    nb_records = __flush_index_entries(index_file, entries, position, nb_records)
+                    entries = array.array("Q")
+            nb_records = __flush_index_entries(index_file, entries, position, nb_records)
+
+            # Adds the 001 of the records not in the old table, the first record wins if a 001 is duplicated
+            index_file.seek(__INDEX_HEADER.size + nb_known_records * __INDEX_INT_SIZE)
+            offsets = array.array("Q")
+            offsets.frombytes(index_file.read((nb_records - nb_known_records) * __INDEX_INT_SIZE))
+            offsets.append(size)
+            for index in range(len(offsets) - 1):
+                control_number = get_raw_control_field(mapped[offsets[index]:offsets[index+1]])
+                if control_number is not None and not control_number in positions:
+                    positions[control_number] = nb_known_records + index
+    __write_index_table(index_path, positions, size, nb_records)
+    return nb_records
+
+def __flush_index_entries(index_file:BinaryIO, entries:array.array, indexed_bytes:int, nb_records:int) -> int:
+    """Writes entries at the end of the index, then updates the header (so an interrupted write is ignored).
+    Returns the new number of records"""
+    index_file.seek(0, os.SEEK_END)
+    index_file.write(entries.tobytes())
+    index_file.flush()
+    os.fsync(index_file.fileno())
+    nb_records += len(entries)
+    index_file.seek(0)
+    index_file.write(__INDEX_HEADER.pack(__INDEX_MAGIC, indexed_bytes, nb_records, 0, 0, 0, 0))
+    index_file.flush()
+    return nb_records
+
+def __write_index_table(index_path:str, positions:dict, indexed_bytes:int, nb_records:int):
+    """Writes the 001 table sorted by 001 & its hash table at the end of the index, then marks it as complete"""
+    keys = sorted((control_number.encode("utf-8"), position) for control_number, position in positions.items())
+    key_ends = array.array("Q")
+    key_positions = array.array("Q")
+    end = 0
+    for key, position in keys:
+        end += len(key)
+        key_ends.append(end)
+        key_positions.append(position)
+    # At most half of the buckets are used, so probes stay short
+    nb_buckets = 1 << (2 * len(keys) - 1).bit_length() if len(keys) > 0 else 0
+    buckets = array.array("Q", bytes(nb_buckets * __INDEX_INT_SIZE))
+    for index, (key, _) in enumerate(keys):
+        bucket = get_index_bucket(key, nb_buckets)
+        while buckets[bucket] != 0:
+            bucket = (bucket + 1) & (nb_buckets - 1)
+        buckets[bucket] = index + 1
+    with open(index_path, "r+b") as index_file:
+        index_file.seek(0, os.SEEK_END)
+        index_file.write(key_ends.tobytes())
+        index_file.write(key_positions.tobytes())
+        index_file.write(buckets.tobytes())
+        index_file.write(b"".join(key for key, _ in keys))
+        index_file.flush()
+        os.fsync(index_file.fileno())
+        index_file.seek(0)
+        index_file.write(__INDEX_HEADER.pack(__INDEX_MAGIC, indexed_bytes, nb_records, 1, len(keys), end, nb_buckets))
+        index_file.flush()
+
+class IndexedMARCFile:
+    """Random access to the records of an ISO 2709 file using its offset index (see build_offset_index()),
+    the file and the index are memory-mapped : opening it does not read the index entries, 001 are found
+    in O(1) with the hash table of the index and a record is only parsed when it is accessed.
+    The index is built (or completed) if needed.
+    Use it as a context manager or call close()
+
+    Takes as argument :
+        - mrc_path {str} : the ISO 2709 file
+        - [OPTIONNAL, mrc_path + ".idx"] index_path {str} : the index file
+        - [OPTIONNAL, True] to_unicode {bool} : same as pymarc MARCReader
+        - [OPTIONNAL, True] force_utf8 {bool} : same as pymarc MARCReader
+        - [OPTIONNAL, False] lazy {bool} : returns marc_utils_5.LazyRecord (see parse_raw_record())"""
+
+    def __init__(self, mrc_path:str, index_path:str|None=None, to_unicode:bool=True, force_utf8:bool=True, lazy:bool=False):
+        if index_path is None:
+            index_path = get_index_path(mrc_path)
+        self.mrc_path = mrc_path
+        self.index_path = index_path
+        self.to_unicode = to_unicode
+        self.force_utf8 = force_utf8
+        self.lazy = lazy
+        build_offset_index(mrc_path, index_path)
+        self._index_file = open(index_path, "rb")
+        self._index_mapped = mmap.mmap(self._index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.indexed_bytes, self._nb_records, _, self.offsets, self._key_ends, self._key_positions, self._buckets, self._keys = read_offset_index(self._index_mapped)
+        self._file = open(mrc_path, "rb")
+        self._mapped = None
+        if self._nb_records > 0:
+            self._mapped = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return self._nb_records
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Closes the file and the index"""
+        if self._mapped is not None:
+            self._mapped.close()
+            self._mapped = None
+        self._file.close()
+        if self._index_mapped is not None:
+            # Views on the index must be released before closing it
+            for view in [self.offsets, self._key_ends, self._key_positions, self._buckets, self._keys]:
+                view.release()
+            self._index_mapped.close()
+            self._index_mapped = None
+        self._index_file.close()
+
+    def get_raw(self, position:int) -> bytes:
+        """Returns the raw record at this position (raises an IndexError if it does not exist)"""
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError(f"No record at position {position}")
+        end = self.offsets[position+1] if position + 1 < len(self) else self.indexed_bytes
+        return self._mapped[self.offsets[position]:end]
+
+    def _get_key(self, index:int) -> bytes:
+        """Returns the 001 at this index of the 001 table"""
+        start = self._key_ends[index-1] if index > 0 else 0
+        return bytes(self._keys[start:self._key_ends[index]])
+
+    def get_position(self, control_number:str) -> int|None:
+        """Returns the position of the record with this 001, None if there is none"""
+        nb_buckets = len(self._buckets)
+        if nb_buckets == 0:
+            return None
+        key = control_number.encode("utf-8")
+        # Linear probing from the bucket of the 001 until an empty bucket
+        bucket = get_index_bucket(key, nb_buckets)
+        while self._buckets[bucket] != 0:
+            index = self._buckets[bucket] - 1
+            if self._get_key(index) == key:
+                return self._key_positions[index]
+            bucket = (bucket + 1) & (nb_buckets - 1)
+        return None
+
+    def get_raw_by_control_number(self, control_number:str) -> bytes|None:
+        """Returns the raw record with this 001, None if there is none"""
+        position = self.get_position(control_number)
+        if position is None:
+            return None
+        return self.get_raw(position)
+
+    def __getitem__(self, position:int) -> pymarc.record.Record|None:
+        """Returns the record at this position (None if it is invalid)"""
+        return parse_raw_record(self.get_raw(position), self.to_unicode, self.force_utf8, self.lazy)
+
+    def get_by_control_number(self, control_number:str) -> pymarc.record.Record|None:
+        """Returns the record with this 001, None if there is none or if it is invalid"""
+        raw = self.get_raw_by_control_number(control_number)
+        if raw is None:
+            return None
+        return parse_raw_record(raw, self.to_unicode, self.force_utf8, self.lazy)
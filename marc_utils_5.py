@@ -1,8 +1,87 @@
 # -*- coding: utf-8 -*- 
 
 import pymarc
-from typing import List, Tuple
+from typing import List, Tuple, Iterable, NamedTuple
+from collections import OrderedDict
+import array
+import functools
+import inspect
+import json
 import re
+import threading
+import time
+import warnings
+
+# Optionnal, only used by get_years_bulk()
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# ------------------------------ Regexp cache ------------------------------
+
+class PatternCache:
+    """Bounded LRU registry of compiled regular expressions.
+    Unlike re internal cache, it is not cleared when full, only the least recently used pattern is dropped
+
+    Takes as argument :
+        - [OPTIONNAL, 512] max_size {int} : the maximum number of compiled patterns kept"""
+
+    def __init__(self, max_size:int=512):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._patterns:OrderedDict = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._patterns)
+
+    def get(self, pattern:str|re.Pattern, flags:int=0) -> re.Pattern:
+        """Returns the compiled pattern, compiling it only if it is not in the registry.
+        Already compiled patterns are returned as is (flags can't be set on them, same as re)"""
+        if isinstance(pattern, re.Pattern):
+            if flags:
+                raise ValueError("cannot process flags argument with a compiled pattern")
+            return pattern
+        key = (pattern, flags)
+        compiled = self._patterns.get(key)
+        if compiled is not None:
+            self.hits += 1
+            self._patterns.move_to_end(key)
+            return compiled
+        self.misses += 1
+        compiled = re.compile(pattern, flags)
+        self._patterns[key] = compiled
+        if len(self._patterns) > self.max_size:
+            self._patterns.popitem(last=False)
+        return compiled
+
+    def clear(self):
+        """Empties the registry and resets the counters"""
+        self._patterns.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict:
+        """Returns the registry counters as a dict"""
+        return {"size": len(self._patterns), "max_size": self.max_size, "hits": self.hits, "misses": self.misses}
+
+PATTERN_CACHE = PatternCache()
+
+def compile_pattern(pattern:str|re.Pattern, flags:int=0) -> re.Pattern:
+    """Returns the compiled pattern using the module registry (PATTERN_CACHE)
+
+    Takes as argument :
+        - pattern : regexp pattern (str or already compiled re.Pattern)
+        - [OPTIONNAL, 0] flags : re flags (can't be used with an already compiled pattern)"""
+    return PATTERN_CACHE.get(pattern, flags)
+
+# Patterns used by the years functions
+__YEAR_COPYRIGHT_PATTERN = re.compile(r"(DL|COP\.|COPYRIGHT|COP|C)", flags=re.IGNORECASE)
+__YEAR_STRICT_PATTERN = re.compile(r"\b\d{4}\b")
+__YEAR_LOOSE_PATTERN = re.compile(r"\d{4}")
+__YEAR_UNM_100_PUBLICATION_PATTERN = re.compile(r"(?<=^.{9})\d{4}")
+__YEAR_UNM_100_CREATION_PATTERN = re.compile(r"^\d{4}")
 
 # ------------------------------ utils internal ------------------------------
 
@@ -10,7 +89,851 @@ def __get_all_subfield_values_as_list(field:pymarc.field.Field) -> List[str]:
     """Returns all subfield values (no matter the subfield code) as a list of string
     
     Takes as argument a pymarc Field"""
-    return [elem.value for elem in field.subfields]
+    return [elem.value for elem in read_subfields(field)]
+
+# ------------------------------ Change tracking ------------------------------
+
+class _TrackedFieldList(list):
+    """The fields list of a tracked record, holding its changes in _marc_utils_changes
+    (pymarc records have no __dict__ and can't be weakly referenced)"""
+
+def __get_tracked_changes(record:pymarc.record.Record) -> dict|None:
+    return getattr(record.fields, "_marc_utils_changes", None)
+
+def track_changes(record:pymarc.record.Record) -> pymarc.record.Record:
+    """Starts tracking the modifications made to the record by the functions of this module
+    (dirty flag), and returns the record.
+    The changes are kept by the record fields list (nothing is kept once the record is deleted) :
+    replacing it ("record.fields = ...") stops the tracking.
+    Use untrack_changes() once the record is processed
+
+    Takes as argument :
+        - record : a pymarc record"""
+    if not hasattr(record.fields, "__dict__"):
+        record.fields = _TrackedFieldList(record.fields)
+    record.fields._marc_utils_changes = {}
+    return record
+
+def is_tracked(record:pymarc.record.Record) -> bool:
+    """Returns True if the modifications of the record are tracked"""
+    return __get_tracked_changes(record) is not None
+
+def mark_modified(record:pymarc.record.Record, operation:str):
+    """Marks the record as modified by this operation if it is tracked.
+    Every function of this module editing a record calls it, use it for other edits
+
+    Takes as argument :
+        - record : a pymarc record
+        - operation {str} : the name of the operation that modified the record"""
+    changes = __get_tracked_changes(record)
+    if changes is not None:
+        changes[operation] = changes.get(operation, 0) + 1
+
+def is_modified(record:pymarc.record.Record) -> bool:
+    """Returns True if the tracked record was modified"""
+    return len(get_changes(record)) > 0
+
+def get_changes(record:pymarc.record.Record) -> dict:
+    """Returns a dict with, for each operation that modified the tracked record, the number of calls
+    that modified it (empty if the record is not modified or not tracked)"""
+    changes = __get_tracked_changes(record)
+    if changes is None:
+        return {}
+    return dict(changes)
+
+def untrack_changes(record:pymarc.record.Record) -> dict:
+    """Stops tracking the record and returns its changes (see get_changes())"""
+    changes = get_changes(record)
+    if is_tracked(record):
+        del record.fields._marc_utils_changes
+    return changes
+
+def get_field_snapshot(field:pymarc.field.Field) -> tuple:
+    """Returns a tuple with the content of the field, two snapshots are equal if the field did not change"""
+    if field.is_control_field():
+        return (field.tag, field.data)
+    return (field.tag, tuple(field.indicators), tuple(read_subfields(field)))
+
+def get_record_snapshot(record:pymarc.record.Record) -> tuple:
+    """Returns a tuple with the leader and the content of every field of the record,
+    two snapshots are equal if the record did not change, whatever the function that edited it.
+    Untouched LazyField are not decoded
+
+    Takes as argument :
+        - record : a pymarc record"""
+    snapshot = [str(record.leader)]
+    for field in record.fields:
+        if isinstance(field, LazyField) and field.is_untouched():
+            snapshot.append((field.tag, field._raw))
+        else:
+            snapshot.append(get_field_snapshot(field))
+    return tuple(snapshot)
+
+# ------------------------------ Subfield code view ------------------------------
+
+class SubfieldCodeView:
+    """Subfield codes of a field, built in a single pass on its subfields
+    (build it once per field in functions doing several lookups).
+    Gives code presence, code counts and code -> values lookups in O(1).
+    The view is not updated if the field subfields change
+
+    Takes as argument :
+        - field : a pymarc field"""
+
+    __slots__ = ("values_by_code",)
+
+    def __init__(self, field:pymarc.field.Field):
+        self.values_by_code = {}
+        for subf in read_subfields(field):
+            self.values_by_code.setdefault(subf.code, []).append(subf.value)
+
+    def has(self, code:str) -> bool:
+        """Returns True if the field has a subfield with this code"""
+        return code in self.values_by_code
+
+    def count(self, code:str) -> int:
+        """Returns the number of subfields with this code"""
+        return len(self.values_by_code.get(code, []))
+
+    def values(self, code:str) -> List[str]:
+        """Returns the values of the subfields with this code (as a new list)"""
+        return list(self.values_by_code.get(code, []))
+
+    def codes(self) -> List[str]:
+        """Returns the codes used in the field, in order of first appearance"""
+        return list(self.values_by_code)
+
+    def as_dict(self) -> dict:
+        """Returns the same dict as pymarc subfields_as_dict()"""
+        return {code: list(values) for code, values in self.values_by_code.items()}
+
+def get_code_view(field:pymarc.field.Field) -> SubfieldCodeView:
+    """Returns a new SubfieldCodeView of the field (views are not cached, nothing keeps the field)
+
+    Takes as argument :
+        - field : a pymarc field"""
+    return SubfieldCodeView(field)
+
+# ------------------------------ Indexed record ------------------------------
+
+class _IndexedFieldList(list):
+    """The fields list of an IndexedRecord, counting its changes so edits made directly on the list
+    (record.fields.append(...), record.fields[0] = ...) are detected"""
+    version = 0
+
+def __count_list_changes(name:str):
+    method = getattr(list, name)
+    def counted(self, *args, **kwargs):
+        self.version += 1
+        return method(self, *args, **kwargs)
+    counted.__name__ = name
+    return counted
+
+for __name in ["append", "extend", "insert", "pop", "remove", "clear", "sort", "reverse", "__setitem__", "__delitem__", "__iadd__", "__imul__"]:
+    setattr(_IndexedFieldList, __name, __count_list_changes(__name))
+
+class IndexedRecord(pymarc.record.Record):
+    """A pymarc record keeping a tag -> fields index, so get_fields(), record[tag],
+    "tag in record" do not scan every field.
+    A tag is indexed by a scan of the fields the first time it is looked up, then kept up to date
+    by add_field(), add_ordered_field(), add_grouped_field(), remove_field(), remove_fields() and set_field_tag().
+    Edits of the fields list (direct changes or its replacement) are detected by the record own list
+    and the index is emptied on the next lookup.
+    Fields are not watched : use set_field_tag() to change a field tag, or reindex() after "field.tag = ...".
+
+    Created like a pymarc record, or from an existing one using IndexedRecord.from_record()"""
+
+    def __init__(self, *args, **kwargs):
+        self._index = None
+        self._synced = None
+        super().__init__(*args, **kwargs)
+
+    def __getstate__(self) -> dict:
+        # The index is rebuilt after copying or unpickling
+        state = self.__dict__.copy()
+        state["_index"] = None
+        state["_synced"] = None
+        return state
+
+    @classmethod
+    def from_record(cls, record:pymarc.record.Record):
+        """Returns an IndexedRecord with the leader & fields of the record (fields are not copied)"""
+        indexed = cls(to_unicode=record.to_unicode, force_utf8=record.force_utf8)
+        indexed.leader = record.leader
+        indexed.fields = record.fields
+        return indexed
+
+    # Replacing the fields list resets the index
+    @property
+    def fields(self) -> List[pymarc.field.Field]:
+        return self._fields
+
+    @fields.setter
+    def fields(self, fields:List[pymarc.field.Field]):
+        self._fields = _IndexedFieldList(fields)
+        self._index = None
+
+    def reindex(self, *tags:str):
+        """Re-indexes these tags (or every tag if no tag is given) on their next lookup.
+        Needed after "field.tag = ..." on a field of the record (for its old & new tag)"""
+        if len(tags) == 0 or self._index is None:
+            self._index = None
+        else:
+            for tag in tags:
+                self._index.pop(tag, None)
+
+    def _is_synced(self) -> bool:
+        """Returns True if the fields list was not edited outside of the record methods since the index was updated"""
+        return self._index is not None and self._synced == self._fields.version
+
+    def _sync(self):
+        self._synced = self._fields.version
+
+    def _get_index(self) -> dict:
+        """Returns the index (tag -> fields of the tag for looked up tags), emptied if the fields list was edited"""
+        if not self._is_synced():
+            self._index = {}
+            self._sync()
+        return self._index
+
+    def _get_tag_list(self, tag:str) -> List[pymarc.field.Field]:
+        """Returns the index list for this tag (not a copy), indexing the tag if needed"""
+        index = self._get_index()
+        fields = index.get(tag)
+        if fields is None:
+            fields = [field for field in self._fields if field.tag == tag]
+            index[tag] = fields
+        return fields
+
+    def get_fields(self, *args) -> List[pymarc.field.Field]:
+        tags = []
+        for arg in args:
+            if isinstance(arg, list):
+                tags += arg
+            else:
+                tags.append(arg)
+        if len(tags) == 0:
+            return self._fields
+        if len(tags) == 1:
+            return list(self._get_tag_list(tags[0]))
+        # Multiple tags : tags not indexed yet are indexed with a single scan
+        index = self._get_index()
+        tags = set(tags)
+        not_indexed = set(tag for tag in tags if not tag in index)
+        if len(not_indexed) > 0:
+            found = [field for field in self._fields if field.tag in not_indexed]
+            for tag in not_indexed:
+                index[tag] = []
+            for field in found:
+                index[field.tag].append(field)
+            # No other tag : the scan found them all in record order
+            if len(not_indexed) == len(tags):
+                return found
+        # Only scan the record if more than one of them is used
+        used_tags = set(tag for tag in tags if len(index[tag]) > 0)
+        if len(used_tags) == 0:
+            return []
+        if len(used_tags) == 1:
+            return list(index[used_tags.pop()])
+        return [field for field in self._fields if field.tag in used_tags]
+
+    def get(self, tag:str, default:pymarc.field.Field|None=None) -> pymarc.field.Field|None:
+        fields = self._get_tag_list(tag)
+        if len(fields) == 0:
+            return default
+        return fields[0]
+
+    def __getitem__(self, tag:str) -> pymarc.field.Field:
+        fields = self._get_tag_list(tag)
+        if len(fields) == 0:
+            raise KeyError
+        return fields[0]
+
+    def __contains__(self, tag:str) -> bool:
+        return len(self._get_tag_list(tag)) > 0
+
+    def add_field(self, *fields):
+        synced = self._is_synced()
+        super().add_field(*fields)
+        if synced:
+            for field in fields:
+                if field.tag in self._index:
+                    self._index[field.tag].append(field)
+            self._sync()
+
+    def add_ordered_field(self, *fields):
+        for field in fields:
+            synced = self._is_synced()
+            super().add_ordered_field(field)
+            if synced:
+                self._index_new_fields(field.tag, [field])
+                self._sync()
+
+    def add_grouped_field(self, *fields):
+        for field in fields:
+            synced = self._is_synced()
+            super().add_grouped_field(field)
+            if synced:
+                self._index_new_fields(field.tag, [field])
+                self._sync()
+
+    def _index_new_fields(self, tag:str, new_fields:List[pymarc.field.Field]):
+        """Adds fields inserted in the record (in the record order) to the index list of their tag"""
+        tag_list = self._index.get(tag)
+        if tag_list is None:
+            return
+        # First fields of their tag, or appended at the end of the record (so also at the end of their tag list)
+        if len(tag_list) == 0 or self._fields[len(self._fields) - len(new_fields):] == new_fields:
+            tag_list += new_fields
+        else:
+            # Their place among the fields with the same tag is found on the next lookup
+            del self._index[tag]
+
+    def remove_field(self, *fields):
+        # Single pass on the fields (pymarc walks the list once per field),
+        # pymarc is used to raise FieldNotFound if a field is missing
+        removed_ids = set(id(field) for field in fields)
+        remaining = [field for field in self._fields if id(field) not in removed_ids]
+        if len(removed_ids) != len(fields) or len(self._fields) - len(remaining) != len(removed_ids):
+            super().remove_field(*fields)
+            return
+        self._set_fields(remaining, fields, [])
+
+    def remove_fields(self, *tags):
+        synced = self._is_synced()
+        super().remove_fields(*tags)
+        if synced:
+            for tag in tags:
+                self._index[tag] = []
+            self._sync()
+
+    def _set_fields(self, fields:List[pymarc.field.Field], removed:List[pymarc.field.Field], added:List[pymarc.field.Field]):
+        """Replaces the content of the fields list, updating the index.
+        fields must be the record fields without the removed ones, with the added ones inserted
+        (added is in the order of fields)"""
+        synced = self._is_synced()
+        self._fields[:] = fields
+        if not synced:
+            return
+        removed_ids = set(id(field) for field in removed)
+        for tag in set(field.tag for field in removed):
+            if tag in self._index:
+                self._index[tag] = [field for field in self._index[tag] if id(field) not in removed_ids]
+        added_by_tag = {}
+        for field in added:
+            added_by_tag.setdefault(field.tag, []).append(field)
+        for tag, new_fields in added_by_tag.items():
+            self._index_new_fields(tag, new_fields)
+        self._sync()
+
+    def _set_field_tag(self, field:pymarc.field.Field, tag:str):
+        """Changes the tag of the field, updating the index"""
+        old_tag = field.tag
+        field.tag = tag
+        if self._is_synced():
+            if old_tag in self._index:
+                self._index[old_tag] = [indexed_field for indexed_field in self._index[old_tag] if indexed_field is not field]
+            self._index_new_fields(tag, [field])
+
+def set_field_tag(record:pymarc.record.Record, field:pymarc.field.Field, tag:str, operation:str="set_field_tag") -> bool:
+    """Changes the tag of the field, keeping the record index up to date if it's an IndexedRecord.
+    Returns True if the tag changed
+
+    Takes as argument :
+        - record : the pymarc record the field is in
+        - field : the field to edit
+        - tag : the new tag (str)
+        - [OPTIONNAL, "set_field_tag"] operation {str} : the operation name used for change tracking"""
+    if field.tag == tag:
+        return False
+    if isinstance(record, IndexedRecord):
+        record._set_field_tag(field, tag)
+    else:
+        field.tag = tag
+    mark_modified(record, operation)
+    return True
+
+# ------------------------------ Lazy record ------------------------------
+
+# ISO 2709 separators
+FIELD_TERMINATOR = b"\x1e"
+SUBFIELD_INDICATOR = b"\x1f"
+
+class LazyField(pymarc.field.Field):
+    """A pymarc field built from its ISO 2709 bytes, only decoded when its indicators, subfields or data
+    are accessed (the tag is always available).
+    If its content did not change since it was decoded, as_marc() returns the original bytes
+
+    Takes as argument :
+        - tag {str}
+        - raw {bytes} : the field data, field terminator included (added if missing)
+        - [OPTIONNAL, "utf-8"] encoding {str} : the encoding of raw, "iso8859-1" is read as MARC-8 like pymarc does
+        - [OPTIONNAL, "strict"] utf8_handling {str} : same as pymarc Record
+        - [OPTIONNAL, False] hide_utf8_warnings {bool} : same as pymarc Record (MARC-8 only)"""
+    __slots__ = ("_raw", "_encoding", "_utf8_handling", "_hide_utf8_warnings", "_decoded", "_original")
+
+    # Slots of pymarc Field, the properties below replace them
+    # (in a dict, else getting them from an instance would read the slot)
+    _base_slots = {name: pymarc.field.Field.__dict__[name] for name in ["subfields", "_indicators", "data"]}
+
+    def __init__(self, tag:str, raw:bytes, encoding:str="utf-8", utf8_handling:str="strict", hide_utf8_warnings:bool=False):
+        self.tag = tag
+        self.control_field = tag < "010" and tag.isdigit()
+        # as_marc() writes raw as is, so it must end like a pymarc field
+        if not raw.endswith(FIELD_TERMINATOR):
+            raw += FIELD_TERMINATOR
+        self._raw = raw
+        self._encoding = encoding
+        self._utf8_handling = utf8_handling
+        self._hide_utf8_warnings = hide_utf8_warnings
+        self._decoded = False
+        self._original = None
+
+    def __reduce__(self):
+        # Copies & pickles are plain pymarc fields
+        if self.control_field:
+            return (pymarc.field.Field, (self.tag, None, None, self.data))
+        return (pymarc.field.Field, (self.tag, self.indicators, list(self.subfields)))
+
+    def _decode_value(self, data:bytes) -> str:
+        """Decodes a subfield value, same as pymarc Record.decode_marc() (MARC-8 for iso8859-1)"""
+        if self._encoding == "utf-8":
+            return data.decode("utf-8", self._utf8_handling)
+        if self._encoding == "iso8859-1":
+            return pymarc.marc8.marc8_to_unicode(data, self._hide_utf8_warnings)
+        return data.decode(self._encoding)
+
+    def _decode(self):
+        """Decodes the field, same as pymarc Record.decode_marc()"""
+        data = self._raw[:-1]
+        if self.control_field:
+            self._base_slots["data"].__set__(self, data.decode(self._encoding))
+            self._base_slots["_indicators"].__set__(self, None)
+            self._base_slots["subfields"].__set__(self, [])
+        else:
+            parts = data.split(SUBFIELD_INDICATOR)
+            indicators = parts[0].decode("ascii") + "  "
+            subfields = []
+            for part in parts[1:]:
+                if not part:
+                    continue
+                skip_bytes = 1
+                try:
+                    code = part[0:1].decode("ascii")
+                except UnicodeDecodeError:
+                    warnings.warn(pymarc.exceptions.BadSubfieldCodeWarning(part), stacklevel=2)
+                    code, skip_bytes = pymarc.record.normalize_subfield_code(part)
+                subfields.append(pymarc.Subfield(code, self._decode_value(part[skip_bytes:])))
+            self._base_slots["data"].__set__(self, None)
+            self._base_slots["_indicators"].__set__(self, pymarc.field.Indicators(indicators[0], indicators[1]))
+            self._base_slots["subfields"].__set__(self, subfields)
+        # Only flagged once decoded, so a decoding error is raised again on the next access
+        self._decoded = True
+        self._original = self._get_content()
+
+    def _get_content(self) -> tuple:
+        if self.control_field:
+            return (self._base_slots["data"].__get__(self),)
+        return (tuple(self._base_slots["_indicators"].__get__(self)), tuple(self._base_slots["subfields"].__get__(self)))
+
+    def is_decoded(self) -> bool:
+        """Returns True if the field was decoded"""
+        return self._decoded
+
+    def is_untouched(self) -> bool:
+        """Returns True if the content of the field is the same as its original bytes"""
+        return not self._decoded or self._get_content() == self._original
+
+    @property
+    def subfields(self) -> List[pymarc.field.Subfield]:
+        if not self._decoded:
+            self._decode()
+        return self._base_slots["subfields"].__get__(self)
+
+    @subfields.setter
+    def subfields(self, value:List[pymarc.field.Subfield]):
+        if not self._decoded:
+            self._decode()
+        self._base_slots["subfields"].__set__(self, value)
+
+    @property
+    def _indicators(self) -> pymarc.field.Indicators|None:
+        if not self._decoded:
+            self._decode()
+        return self._base_slots["_indicators"].__get__(self)
+
+    @_indicators.setter
+    def _indicators(self, value:pymarc.field.Indicators|None):
+        if not self._decoded:
+            self._decode()
+        self._base_slots["_indicators"].__set__(self, value)
+
+    @property
+    def data(self) -> str|None:
+        if not self._decoded:
+            self._decode()
+        return self._base_slots["data"].__get__(self)
+
+    @data.setter
+    def data(self, value:str|None):
+        if not self._decoded:
+            self._decode()
+        self._base_slots["data"].__set__(self, value)
+
+    def _is_raw_kept(self) -> bool:
+        """Returns True if decoding then encoding the field gives back its original bytes
+        (not the case for invalid utf-8 bytes with utf8_handling other than strict)"""
+        if self._encoding != "utf-8" or self._utf8_handling == "strict":
+            return True
+        try:
+            self._raw.decode("utf-8")
+        except UnicodeDecodeError:
+            return False
+        return True
+
+    def as_marc(self, encoding:str) -> bytes:
+        """Returns the original bytes if the field did not change (and the encoding is the same)"""
+        if encoding == self._encoding and self.is_untouched() and self._is_raw_kept():
+            return self._raw
+        return super().as_marc(encoding)
+
+    as_marc21 = as_marc
+
+class LazyRecord(pymarc.record.Record):
+    """A pymarc record built from ISO 2709 bytes that only reads the leader and the directory :
+    fields are LazyField, decoded on first access to their content.
+    Functions only using some tags (e.g. fix_7XX()) do not decode the other fields,
+    and as_marc() writes untouched fields as their original bytes.
+    Created like a pymarc record (LazyRecord(raw, force_utf8=True)).
+    With to_unicode=False, it is a regular pymarc record"""
+
+    def decode_marc(self, marc:bytes, to_unicode:bool=True, force_utf8:bool=False, hide_utf8_warnings:bool=False, utf8_handling:str="strict", encoding:str="iso8859-1"):
+        if not to_unicode:
+            return super().decode_marc(marc, to_unicode, force_utf8, hide_utf8_warnings, utf8_handling, encoding)
+        leader = marc[0:24].decode("ascii")
+        if len(leader) != 24:
+            raise pymarc.exceptions.RecordLeaderInvalid
+        # Same as pymarc : utf-8, else MARC-8 if encoding is iso8859-1 (see LazyField)
+        if leader[9] == "a" or self.force_utf8:
+            encoding = "utf-8"
+        self.leader = pymarc.leader.Leader(leader)
+        base_address = int(marc[12:17])
+        if base_address <= 0:
+            raise pymarc.exceptions.BaseAddressNotFound
+        if base_address >= len(marc):
+            raise pymarc.exceptions.BaseAddressInvalid
+        if len(marc) < int(self.leader[:5]):
+            raise pymarc.exceptions.TruncatedRecord
+        directory = marc[24:base_address-1].decode("ascii")
+        if len(directory) % 12 != 0:
+            raise pymarc.exceptions.RecordDirectoryInvalid
+        # Same as pymarc, a record needs at least one field
+        if len(directory) == 0:
+            raise pymarc.exceptions.NoFieldsFound
+        fields = []
+        for index in range(0, len(directory), 12):
+            tag = directory[index:index+3]
+            start = base_address + int(directory[index+7:index+12])
+            fields.append(LazyField(tag, marc[start:start+int(directory[index+3:index+7])], encoding, utf8_handling, hide_utf8_warnings))
+        self.fields = fields
+
+    def get_decoded_ratio(self) -> float:
+        """Returns the share of fields that were decoded (0 to 1)"""
+        if len(self.fields) == 0:
+            return 0.0
+        return sum(1 for field in self.fields if isinstance(field, LazyField) and field.is_decoded()) / len(self.fields)
+
+# ------------------------------ Compact record ------------------------------
+
+class InternPool:
+    """Shared instances of tags, subfield codes, indicators & subfields, so identical values
+    are stored once across fields and records (see compact_record()).
+    Subfields with a value longer than max_value_length are not shared, they rarely repeat
+    and would only make the pool grow
+
+    Takes as argument :
+        - [OPTIONNAL, 64] max_value_length {int}"""
+
+    def __init__(self, max_value_length:int=64):
+        self.max_value_length = max_value_length
+        self._strings:dict = {}
+        self._indicators:dict = {}
+        self._subfields:dict = {}
+
+    def __len__(self) -> int:
+        return len(self._strings) + len(self._indicators) + len(self._subfields)
+
+    def string(self, value:str) -> str:
+        """Returns the shared instance of a tag or a subfield code"""
+        return self._strings.setdefault(value, value)
+
+    def indicators(self, indicators:Iterable[str]) -> pymarc.field.Indicators:
+        """Returns the shared instance of these indicators"""
+        key = tuple(indicators)
+        shared = self._indicators.get(key)
+        if shared is None:
+            shared = self._indicators[key] = pymarc.field.Indicators(*key)
+        return shared
+
+    def subfield(self, subfield:pymarc.Subfield) -> pymarc.Subfield:
+        """Returns the shared instance of this subfield"""
+        if len(subfield.value) > self.max_value_length:
+            return pymarc.Subfield(self.string(subfield.code), subfield.value)
+        shared = self._subfields.get(subfield)
+        if shared is None:
+            shared = self._subfields[subfield] = pymarc.Subfield(self.string(subfield.code), subfield.value)
+        return shared
+
+    def clear(self):
+        """Empties the pool (already compacted fields keep their instances)"""
+        self._strings.clear()
+        self._indicators.clear()
+        self._subfields.clear()
+
+class CompactField(pymarc.field.Field):
+    """A pymarc data field storing its subfields as an immutable tuple, which subfields can be
+    shared with other fields through an InternPool.
+    The subfields list is only created (copy-on-write) when field.subfields is used,
+    from then on it works as a regular pymarc field until compact() is called again.
+    Iterating, get(), get_subfields(), value(), subfields_as_dict() & as_marc() use the tuple
+
+    Takes as argument :
+        - tag {str}
+        - indicators {list of 2 str}
+        - subfields {list or tuple of pymarc.Subfield}
+        - [OPTIONNAL, None] pool {InternPool} : the pool to share tags, indicators & subfields with"""
+    __slots__ = ("_shared",)
+
+    # Slot of pymarc Field, the property below replaces it
+    # (in a dict, else getting it from an instance would read the slot)
+    _base_slots = {"subfields": pymarc.field.Field.__dict__["subfields"]}
+
+    def __init__(self, tag:str, indicators:Iterable[str], subfields:Iterable[pymarc.Subfield], pool:InternPool|None=None):
+        self.control_field = False
+        self.data = None
+        if pool is None:
+            self.tag = tag
+            self._indicators = pymarc.field.Indicators(*indicators)
+            self._shared = tuple(subfields)
+        else:
+            self.tag = pool.string(tag)
+            self._indicators = pool.indicators(indicators)
+            self._shared = tuple(pool.subfield(subf) for subf in subfields)
+
+    def __reduce__(self):
+        # Copies & pickles stay compact (pickle keeps subfields shared inside a same dump)
+        return (CompactField, (self.tag, tuple(self._indicators), self._get_subfields()))
+
+    def _get_subfields(self) -> Tuple[pymarc.Subfield]|List[pymarc.Subfield]:
+        """Returns the subfields without creating the list"""
+        if self._shared is not None:
+            return self._shared
+        return self._base_slots["subfields"].__get__(self)
+
+    def is_shared(self) -> bool:
+        """Returns True if the subfields are still the shared tuple"""
+        return self._shared is not None
+
+    def compact(self, pool:InternPool|None=None) -> "CompactField":
+        """Stores the subfields as a tuple again (shared through the pool if one is given), returns the field"""
+        if pool is not None:
+            self.tag = pool.string(self.tag)
+            self._indicators = pool.indicators(self._indicators)
+        if self._shared is None:
+            subfields = self._base_slots["subfields"].__get__(self)
+            self._base_slots["subfields"].__delete__(self)
+            self._shared = tuple(subfields)
+        if pool is not None:
+            self._shared = tuple(pool.subfield(subf) for subf in self._shared)
+        return self
+
+    def to_field(self) -> pymarc.field.Field:
+        """Returns the field as a regular pymarc field"""
+        return pymarc.field.Field(self.tag, self._indicators, list(self._get_subfields()))
+
+    @property
+    def subfields(self) -> List[pymarc.field.Subfield]:
+        if self._shared is not None:
+            self._base_slots["subfields"].__set__(self, list(self._shared))
+            self._shared = None
+        return self._base_slots["subfields"].__get__(self)
+
+    @subfields.setter
+    def subfields(self, value:List[pymarc.field.Subfield]):
+        self._base_slots["subfields"].__set__(self, value)
+        self._shared = None
+
+    def __iter__(self):
+        return iter(self._get_subfields())
+
+    def __contains__(self, code:str) -> bool:
+        return any(subf.code == code for subf in self._get_subfields())
+
+    def get(self, code:str, default:str|None=None) -> str|None:
+        for subf in self._get_subfields():
+            if subf.code == code:
+                return subf.value
+        return default
+
+    def get_subfields(self, *codes) -> List[str]:
+        return [subf.value for subf in self._get_subfields() if subf.code in codes]
+
+    def value(self) -> str:
+        return " ".join(subf.value.strip() for subf in self._get_subfields())
+
+    def subfields_as_dict(self) -> dict:
+        output = {}
+        for subf in self._get_subfields():
+            output.setdefault(subf.code, []).append(subf.value)
+        return output
+
+    def as_marc(self, encoding:str) -> bytes:
+        subfields = "".join(f"\x1f{subf.code}{subf.value}" for subf in self._get_subfields())
+        return f"{self._indicators[0]}{self._indicators[1]}{subfields}\x1e".encode(encoding)
+
+    as_marc21 = as_marc
+
+def read_subfields(field:pymarc.field.Field) -> List[pymarc.Subfield]|Tuple[pymarc.Subfield]:
+    """Returns the subfields of the field without copying them : the tuple of a CompactField
+    (so it is not expanded), else field.subfields. Must not be edited, read-only functions use it
+
+    Takes as argument :
+        - field : a pymarc field"""
+    if isinstance(field, CompactField):
+        return field._get_subfields()
+    return field.subfields
+
+def compact_field(field:pymarc.field.Field, pool:InternPool|None=None) -> pymarc.field.Field:
+    """Returns the field as a CompactField (control fields are returned with a shared tag).
+    CompactField are compacted again instead
+
+    Takes as argument :
+        - field : a pymarc field
+        - [OPTIONNAL, None] pool {InternPool} : the pool to share tags, indicators & subfields with"""
+    if isinstance(field, CompactField):
+        return field.compact(pool)
+    if field.is_control_field():
+        if pool is not None:
+            field.tag = pool.string(field.tag)
+        return field
+    return CompactField(field.tag, field.indicators, read_subfields(field), pool)
+
+def compact_record(record:pymarc.record.Record, pool:InternPool|None=None) -> InternPool:
+    """Replaces every data field of the record by a CompactField, with tags, indicators & subfields
+    shared through the pool. The content of the record does not change.
+    Returns the pool, so it can be used for the next records (identical values are only shared inside a same pool)
+
+    Takes as argument :
+        - record : a pymarc record
+        - [OPTIONNAL, None] pool {InternPool} : the pool to use, a new one if None"""
+    if pool is None:
+        pool = InternPool()
+    record.fields[:] = [compact_field(field, pool) for field in record.fields]
+    return pool
+
+def expand_record(record:pymarc.record.Record):
+    """Replaces every CompactField of the record by a regular pymarc field (reverts compact_record())
+
+    Takes as argument :
+        - record : a pymarc record"""
+    record.fields[:] = [field.to_field() if isinstance(field, CompactField) else field for field in record.fields]
+
+# ------------------------------ Mutation batch ------------------------------
+
+class FieldMutationBatch:
+    """Collects fields to add & fields to remove from a record and applies them all
+    with a single rebuild of the fields list on commit(), instead of one list walk per field.
+    Can be used as a context manager, committing at the end of the block.
+
+    On commit, removed fields are removed first, then new fields are placed where
+    pymarc add_ordered_field() would have placed them, in the order they were added.
+
+    Takes as argument :
+        - record : the pymarc record to edit"""
+
+    def __init__(self, record:pymarc.record.Record):
+        self.record = record
+        self.added = []
+        self.removed = []
+
+    def __len__(self) -> int:
+        return len(self.added) + len(self.removed)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+
+    def add_ordered_field(self, *fields:pymarc.field.Field):
+        """Adds the fields on commit, like pymarc add_ordered_field()"""
+        self.added.extend(fields)
+
+    def remove_field(self, *fields:pymarc.field.Field):
+        """Removes the fields on commit, like pymarc remove_field()"""
+        self.removed.extend(fields)
+
+    def commit(self) -> bool:
+        """Applies every collected change to the record and empties the batch.
+        Returns True if the record changed (new fields identical to the removed ones at the same place
+        are not a change).
+        Raises pymarc FieldNotFound if a removed field is not in the record"""
+        if len(self) == 0:
+            return False
+        # Remove fields (by identity, like pymarc does as fields have no equality)
+        removed_ids = set(id(field) for field in self.removed)
+        remaining = [field for field in self.record.fields if id(field) not in removed_ids]
+        if len(self.record.fields) - len(remaining) != len(removed_ids):
+            raise pymarc.exceptions.FieldNotFound()
+
+        # add_ordered_field() inserts before the first field with a greater (or non numeric) tag,
+        # or at the end : the minimum of the first positions of these tags
+        tags = [field.tag for field in remaining]
+        first_positions = {tag: tags.index(tag) for tag in set(tags)}
+        # anchor position -> list of ((is not numeric, tag), new field)
+        inserts = {}
+        for field in self.added:
+            if field.tag.isdigit():
+                position = min((first_position for tag, first_position in first_positions.items()
+                                if not tag.isdigit() or int(tag) > int(field.tag)), default=len(remaining))
+                key = (0, int(field.tag))
+            else:
+                position = len(remaining)
+                key = (1, 0)
+            inserts.setdefault(position, []).append((key, field))
+
+        # Rebuild the list, fields inserted before the same field are sorted by tag (stable sort)
+        new_fields = []
+        added = []
+        previous = 0
+        for position in sorted(inserts):
+            inserted = [field for key, field in sorted(inserts[position], key=lambda elem: elem[0])]
+            new_fields += remaining[previous:position]
+            new_fields += inserted
+            added += inserted
+            previous = position
+        new_fields += remaining[previous:]
+        old_fields = list(self.record.fields)
+        if isinstance(self.record, IndexedRecord):
+            # Only the added & removed fields are re-indexed
+            self.record._set_fields(new_fields, self.removed, added)
+        else:
+            self.record.fields[:] = new_fields
+        self.added = []
+        self.removed = []
+
+        # Checks if something changed
+        if len(old_fields) != len(new_fields):
+            return True
+        for old_field, new_field in zip(old_fields, new_fields):
+            if old_field is new_field:
+                continue
+            if (old_field.tag != new_field.tag or old_field.control_field != new_field.control_field
+                    or old_field.data != new_field.data or old_field.indicators != new_field.indicators
+                    or list(read_subfields(old_field)) != list(read_subfields(new_field))):
+                return True
+        return False
 
 # ------------------------------ Gettign data ------------------------------
 
@@ -25,7 +948,7 @@ def get_years_in_specific_subfield(record:pymarc.record.Record, tag:str, code:st
     dates = []
     for field in record.get_fields(tag):
         for subfield in field.get_subfields(code):
-            years = re.findall(r"\b\d{4}\b", re.sub(r"(DL|COP\.|COPYRIGHT|COP|C)", "", subfield, flags=re.IGNORECASE))
+            years = __YEAR_STRICT_PATTERN.findall(__YEAR_COPYRIGHT_PATTERN.sub("", subfield))
             if len(years) > 0:
                 dates.append(int(years[0]))
     return dates
@@ -40,12 +963,12 @@ def get_year_from_UNM_100(record:pymarc.record.Record, creation:bool=False) -> L
     dates = []
     PATTERN = None
     if not creation:
-        PATTERN = r"(?<=^.{9})\d{4}"
+        PATTERN = __YEAR_UNM_100_PUBLICATION_PATTERN
     else:
-        PATTERN = r"^\d{4}"
+        PATTERN = __YEAR_UNM_100_CREATION_PATTERN
     for field in record.get_fields("100"):
         for subfield in field.get_subfields("a"):
-            years = re.findall(PATTERN, subfield)
+            years = PATTERN.findall(subfield)
             if len(years) > 0:
                 dates.append(int(years[0]))
     return dates
@@ -60,7 +983,7 @@ def get_years_less_accurate(record:pymarc.record.Record, tag:str) -> List[int]:
     dates = []
     for field in record.get_fields(tag):
         for subfield in __get_all_subfield_values_as_list(field):
-            years = re.findall(r"\d{4}", subfield)
+            years = __YEAR_LOOSE_PATTERN.findall(subfield)
             if len(years) > 0:
                 dates.append(int(years[0]))
     return [date for date in dates if date > 1700 and date < 2100] #https://stackoverflow.com/questions/59925384/python-remove-elements-that-are-greater-than-a-threshold-from-a-list
@@ -84,54 +1007,139 @@ def get_years(record:pymarc.record, tags:List[Tuple[str, str|None]]) -> List[int
             dates += get_years_in_specific_subfield(record, tag, code)
     return dates
 
+class YearsColumns(NamedTuple):
+    """Years of many records as returned by get_years_bulk() :
+        - years : numpy int16 array of all years
+        - offsets : numpy int64 array, years of record n are years[offsets[n]:offsets[n+1]]
+        - spec_index : numpy int16 array, for each year, the index of the (tag, code) it comes from"""
+    years:object
+    offsets:object
+    spec_index:object
+
+def get_years_bulk(records:Iterable[pymarc.record.Record]|str, tags:List[Tuple[str, str|None]]) -> YearsColumns:
+    """Returns the years of many records as numpy arrays (see YearsColumns).
+    For each record, years are the same as get_years() would return.
+    /!\\ Needs numpy
+
+    Takes as argument :
+        - records : an iterable of records, or the path to an ISO 2709 file (None records have no years)
+        - tags : list of tuples of str : first value is the tag,
+    second value is either the subfield code or None to use field concatenation one"""
+    if numpy is None:
+        raise ImportError("get_years_bulk() needs numpy")
+    if isinstance(records, str):
+        with open(records, "rb") as file:
+            return get_years_bulk(pymarc.MARCReader(file, to_unicode=True, force_utf8=True), tags)
+
+    # Growing C arrays, so no list is created per record
+    years = array.array("h")
+    offsets = array.array("q", [0])
+    spec_index = array.array("h")
+    for record in records:
+        if record is not None:
+            for index, (tag, code) in enumerate(tags):
+                for field in record.get_fields(tag):
+                    for subf in read_subfields(field):
+                        # Field concatenation one (get_years_less_accurate())
+                        if code is None:
+                            match = __YEAR_LOOSE_PATTERN.search(subf.value)
+                            if match is None:
+                                continue
+                            year = int(match.group())
+                            if year <= 1700 or year >= 2100:
+                                continue
+                        # Field-subfield one (get_years_in_specific_subfield())
+                        else:
+                            if subf.code != code:
+                                continue
+                            match = __YEAR_STRICT_PATTERN.search(__YEAR_COPYRIGHT_PATTERN.sub("", subf.value))
+                            if match is None:
+                                continue
+                            year = int(match.group())
+                        years.append(year)
+                        spec_index.append(index)
+        offsets.append(len(years))
+    return YearsColumns(
+        numpy.frombuffer(years, dtype=numpy.int16),
+        numpy.frombuffer(offsets, dtype=numpy.int64),
+        numpy.frombuffer(spec_index, dtype=numpy.int16)
+    )
+
 # ------------------------------ Sort ------------------------------
 
 def sort_fields_by_tag(record:pymarc.record.Record):
     """Sort the record fields by their tag"""
-    record.fields = sorted(record.fields, key=lambda field: field.tag)
+    new_fields = sorted(record.fields, key=lambda field: field.tag)
+    for old_field, new_field in zip(record.fields, new_fields):
+        if old_field is not new_field:
+            record.fields[:] = new_fields
+            mark_modified(record, "sort_fields_by_tag")
+            return
 
-def __sort_subfields(subf_list:List[pymarc.field.Subfield], sort:List[str]) -> List[str]:
-    """Sort a list of subfields and returns the new list :
+class SortSpec:
+    """A subfield sort compiled once from a sort list, to reuse on many fields :
     * If a subfield code is not in sort, its position will stay the same
     * If a subfield is in sort, it will be moved to that order
     * To sort at the end, use "*" as a code to separate values to use to sort at the beginning
     from values to use to sort at the end
 
     Takes as argument :
-        - subf_list : subfields as given by pymarc.field.Field.subfields (list of pymarc.field.Subfield)
         - sort : a list of subfield codes (str)"""
 
-    # Stores every existing subfield
-    new_subf = []
-    # get positive & negative sort
-    positive_sort = []
-    negative_sort = []
-    if not "*" in sort:
-        positive_sort = sort
-    else:
-        positive_sort = sort[:sort.index("*")]
-        negative_sort = sort[sort.index("*")+1:len(sort)]
-    
-    # Positive sort
-    for code in positive_sort:
-        for subf in subf_list:
-            if subf.code == code:
-                new_subf.append(subf)
+    def __init__(self, sort:List[str]):
+        self.sort = list(sort)
+        # get positive & negative sort
+        positive_sort = self.sort
+        negative_sort = []
+        if "*" in self.sort:
+            positive_sort = self.sort[:self.sort.index("*")]
+            negative_sort = self.sort[self.sort.index("*")+1:len(self.sort)]
+        # Buckets : positive codes, then default, then negative codes
+        self.default_bucket = len(positive_sort)
+        self.nb_buckets = len(positive_sort) + 1 + len(negative_sort)
+        # code -> buckets the subfield goes in (a code listed twice goes in both, like before)
+        self.buckets = {}
+        for index, code in enumerate(positive_sort):
+            self.buckets.setdefault(code, []).append(index)
+        for index, code in enumerate(negative_sort):
+            self.buckets.setdefault(code, []).append(self.default_bucket + 1 + index)
 
-    # Default sort
-    for subf in subf_list:
-        if subf.code not in positive_sort + negative_sort:
-            new_subf.append(subf)
+    def __repr__(self) -> str:
+        return f"SortSpec({self.sort!r})"
 
-    # Negative sort
-    for code in negative_sort:
+    def apply(self, subf_list:List[pymarc.field.Subfield]) -> List[pymarc.field.Subfield]:
+        """Returns the sorted list of subfields, in a single pass on the subfields"""
+        # Nothing to move
+        if len(self.buckets) == 0:
+            return list(subf_list)
+        buckets = [[] for ii in range(self.nb_buckets)]
+        default = [self.default_bucket]
         for subf in subf_list:
-            if subf.code == code:
-                new_subf.append(subf)
-    
-    return new_subf
+            for index in self.buckets.get(subf.code, default):
+                buckets[index].append(subf)
+        new_subf = []
+        for bucket in buckets:
+            new_subf += bucket
+        return new_subf
+
+    __call__ = apply
+
+def __sort_subfields(subf_list:List[pymarc.field.Subfield], sort:List[str]|SortSpec) -> List[str]:
+    """Sort a list of subfields and returns the new list :
+    * If a subfield code is not in sort, its position will stay the same
+    * If a subfield is in sort, it will be moved to that order
+    * To sort at the end, use "*" as a code to separate values to use to sort at the beginning
+    from values to use to sort at the end
+
+    Takes as argument :
+        - subf_list : subfields as given by pymarc.field.Field.subfields (list of pymarc.field.Subfield)
+        - sort : a list of subfield codes (str) or a SortSpec"""
 
-def sort_subfields_for_tag(record:pymarc.record.Record, tag:str, sort:list[str]):
+    if not isinstance(sort, SortSpec):
+        sort = SortSpec(sort)
+    return sort.apply(subf_list)
+
+def sort_subfields_for_tag(record:pymarc.record.Record, tag:str, sort:list[str]|SortSpec):
     """Sort subfields for all field with this tag :
     * If a subfield code is not in sort, its position will stay the same
     * If a subfield is in sort, it will be moved to that order
@@ -141,10 +1149,49 @@ def sort_subfields_for_tag(record:pymarc.record.Record, tag:str, sort:list[str])
     Takes as argument :
         - record : the pymarc record
         - tag : the field tag to sort (str)
-        - sort : a list of subfield codes (str)"""
+        - sort : a list of subfield codes (str) or a SortSpec"""
     
+    if not isinstance(sort, SortSpec):
+        sort = SortSpec(sort)
+    modified = False
     for field in record.get_fields(tag):
-        field.subfields = __sort_subfields(field.subfields, sort)
+        new_subf = sort.apply(read_subfields(field))
+        if new_subf != list(read_subfields(field)):
+            field.subfields = new_subf
+            modified = True
+    if modified:
+        mark_modified(record, "sort_subfields_for_tag")
+
+class SortProfile:
+    """Subfield sorts for multiple tags, applied to a whole record in a single pass on its fields
+
+    Takes as argument :
+        - sorts : dict, keys are tags (str), values are a list of subfield codes (str) or a SortSpec"""
+
+    def __init__(self, sorts:dict):
+        self.sorts = {}
+        for tag in sorts:
+            sort = sorts[tag]
+            if not isinstance(sort, SortSpec):
+                sort = SortSpec(sort)
+            self.sorts[tag] = sort
+
+    def apply(self, record:pymarc.record.Record):
+        """Sorts the subfields of every field with a tag in the profile"""
+        if len(self.sorts) == 0:
+            return
+        modified = False
+        for field in record.get_fields(*self.sorts):
+            sort = self.sorts[field.tag]
+            if not field.is_control_field():
+                new_subf = sort.apply(read_subfields(field))
+                if new_subf != list(read_subfields(field)):
+                    field.subfields = new_subf
+                    modified = True
+        if modified:
+            mark_modified(record, "SortProfile")
+
+    __call__ = apply
 
 # ------------------------------ Force ------------------------------
 
@@ -159,12 +1206,28 @@ def force_indicators(record:pymarc.record.Record, tag:str, ind1:str=None, ind2:s
         - tag : the tag to check (str)
         - ind1 : first indicator (str), defaults to keeping the current one
         - ind2 : first indicator (str), defaults to keeping the current one"""
+    modified = False
     for field in record.get_fields(tag):
-        if ind1 is None:
-            ind1 = field.indicator1
-        if ind2 is None:
-            ind2 = field.indicator2
-        field.indicators = pymarc.field.Indicators(first=ind1, second=ind2)
+        if __force_field_indicators(field, ind1, ind2):
+            modified = True
+    if modified:
+        mark_modified(record, "force_indicators")
+
+def __force_field_indicators(field:pymarc.field.Field, ind1:str=None, ind2:str=None) -> bool:
+    """Forces the indicators of the field, keeping the current one if None.
+    Returns True if the indicators changed"""
+    # Use other variables so the first field indicators are not forced on the next ones
+    new_ind1 = ind1
+    if new_ind1 is None:
+        new_ind1 = field.indicator1
+    new_ind2 = ind2
+    if new_ind2 is None:
+        new_ind2 = field.indicator2
+    new_indicators = pymarc.field.Indicators(first=new_ind1, second=new_ind2)
+    if field.indicators == new_indicators:
+        return False
+    field.indicators = new_indicators
+    return True
 
 # ------------------------------ Add ------------------------------
 
@@ -179,92 +1242,338 @@ def add_missing_subfield_to_field(record:pymarc.record.Record, tag:str, code:str
         - val : the val to add
         - [OPTIONNAL] pos : the position if the subfield is added (default to 999)"""
     
+    modified = False
     for field in record.get_fields(tag):
-        if not code in field.subfields_as_dict():
-            field.add_subfield(code, val, pos)
+        if __add_missing_subfield(field, code, val, pos):
+            modified = True
+    if modified:
+        mark_modified(record, "add_missing_subfield_to_field")
+
+def __add_missing_subfield(field:pymarc.field.Field, code:str, val:str, pos:int=999) -> bool:
+    """Adds the subfield to the field if it does not already have a subfield with this code.
+    Returns True if the subfield was added"""
+    if get_code_view(field).has(code):
+        return False
+    field.add_subfield(code, val, pos)
+    return True
 
 # ------------------------------ Edit ------------------------------
 
-def edit_specific_repeatable_subfield_content_with_regexp(field:pymarc.field.Field, codes:List[str], pattern:str, repl:str) -> List[pymarc.field.Subfield]:
-    """Apply a regexp substitution to all subfields of a code (no flag).
+def edit_specific_repeatable_subfield_content_with_regexp(field:pymarc.field.Field, codes:List[str], pattern:str|re.Pattern, repl:str, flags:int=0) -> List[pymarc.field.Subfield]:
+    """Apply a regexp substitution to all subfields of a code.
     Edits the field and also return the subfield list (as pymarc.field.Subfield)
     
     Takes as argument :
         - field : pymarc Field to edit
         - codes : list of codes to edit (str)
-        - pattern : regexp pattern
-        - repl : regexp sub pattern"""
+        - pattern : regexp pattern (str or compiled re.Pattern)
+        - repl : regexp sub pattern
+        - [OPTIONNAL, 0] flags : re flags (only if pattern is a str)"""
     
-    subf_list:List[pymarc.field.Subfield] = field.subfields
+    pattern = compile_pattern(pattern, flags)
+    subf_list:List[pymarc.field.Subfield] = read_subfields(field)
     new_subf = []
+    changed = False
     for subf in subf_list:
         # If right codes, use the regex replace
         # Subfield are NammedTupples and those are IMMUTABLE /!\
         if subf.code in codes:
-            new_subf.append(subf._replace(value=re.sub(pattern, repl, subf.value)))
-        # Else, add the unedited subfield
-        else:
-            new_subf.append(subf)
+            value = pattern.sub(repl, subf.value)
+            if value != subf.value:
+                subf = subf._replace(value=value)
+                changed = True
+        new_subf.append(subf)
             
-    # Updates the field
-    field.subfields = new_subf
+    # Updates the field (only if needed)
+    if changed:
+        field.subfields = new_subf
     return new_subf
 
-def edit_repeatable_subf_content_with_regexp_for_tag(record:pymarc.record.Record, tag:str, codes:List[str], pattern:str, repl:str):
-    """Apply a regexp substitution to all subfields of a code (no flag).
+def edit_repeatable_subf_content_with_regexp_for_tag(record:pymarc.record.Record, tag:str, codes:List[str], pattern:str|re.Pattern, repl:str, flags:int=0):
+    """Apply a regexp substitution to all subfields of a code.
     
     Takes as argument :
         - record : a pymarc record
         - tag : a field tag (str)
         - codes : list of codes to edit (str)
-        - pattern : regexp pattern
-        - repl : regexp sub pattern"""
+        - pattern : regexp pattern (str or compiled re.Pattern)
+        - repl : regexp sub pattern
+        - [OPTIONNAL, 0] flags : re flags (only if pattern is a str)"""
     
+    # Compile once for all fields
+    pattern = compile_pattern(pattern, flags)
+    modified = False
     for field in record.get_fields(tag):
+        old_subf = read_subfields(field)
         edit_specific_repeatable_subfield_content_with_regexp(field, codes, pattern, repl)
+        # The list is only replaced if a subfield changed
+        if read_subfields(field) is not old_subf:
+            modified = True
+    if modified:
+        mark_modified(record, "edit_repeatable_subf_content_with_regexp_for_tag")
+
+# Patterns that can't be put in an alternation without changing their meaning :
+# backreferences, conditional groups & global inline flags
+__UNCOMBINABLE_PATTERN = re.compile(r"\\[1-9]|\(\?P=|\(\?\(|^\(\?[aiLmsux]+\)")
+__SCOPED_FLAGS = [(re.IGNORECASE, "i"), (re.MULTILINE, "m"), (re.DOTALL, "s"), (re.VERBOSE, "x")]
+
+def compile_combined_pattern(patterns:List[re.Pattern]) -> re.Pattern|None:
+    """Returns a pattern matching a string if any of the patterns matches it (an alternation of all of them),
+    or None if they can't be combined (bytes patterns, backreferences, ASCII or LOCALE flags, etc.)
+
+    Takes as argument :
+        - patterns : list of compiled patterns"""
+    parts = []
+    for pattern in patterns:
+        if not isinstance(pattern.pattern, str) or pattern.flags & (re.ASCII | re.LOCALE) or __UNCOMBINABLE_PATTERN.search(pattern.pattern):
+            return None
+        flags = "".join(letter for flag, letter in __SCOPED_FLAGS if pattern.flags & flag)
+        # (new line before closing the group, in case a verbose pattern ends with a comment)
+        parts.append(f"(?{flags}:{pattern.pattern}\n)" if pattern.flags & re.VERBOSE else f"(?{flags}:{pattern.pattern})")
+    try:
+        return re.compile("|".join(parts))
+    except re.error:
+        return None
+
+class SubstitutionTable:
+    """Ordered regexp substitutions per tag & subfield code, applied to a record in a single pass on its fields.
+    Gives the same result as calling edit_repeatable_subf_content_with_regexp_for_tag() for each rule,
+    but the patterns of a tag & code are combined in one alternation first : a subfield none of them
+    matches is skipped after one search, and only fields with an edited subfield get a new subfield list.
+
+    Takes as argument :
+        - [OPTIONNAL] rules : list of tuples (tag, codes, pattern, repl[, flags]), same as
+    edit_repeatable_subf_content_with_regexp_for_tag() minus the record
+        - [OPTIONNAL, "SubstitutionTable"] operation {str} : the operation name used for change tracking"""
 
+    def __init__(self, rules:List[tuple]=[], operation:str="SubstitutionTable"):
+        self.operation = operation
+        self.rules = []
+        self._compiled = None
+        for rule in rules:
+            self.add(*rule)
 
-def replace_specific_repeatable_subfield_content_not_matching_regexp(field:pymarc.field.Field, codes:List[str], pattern:str, repl:str) -> List[pymarc.field.Subfield]:
-    """Replace all subfields of a code by a value if they do not match a regexp (no flag).
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def __getstate__(self) -> dict:
+        # Rebuilt after unpickling
+        return {"operation": self.operation, "rules": self.rules, "_compiled": None}
+
+    def add(self, tag:str, codes:List[str], pattern:str|re.Pattern, repl:str, flags:int=0) -> "SubstitutionTable":
+        """Adds a rule after the others and returns the table"""
+        self.rules.append((tag, list(codes), compile_pattern(pattern, flags), repl))
+        self._compiled = None
+        return self
+
+    def compile(self) -> dict:
+        """Compiles the table as a dict : tag -> code -> (combined pattern or None, list of (pattern, repl)).
+        Done automatically on first apply()"""
+        compiled = {}
+        for tag, codes, pattern, repl in self.rules:
+            for code in codes:
+                compiled.setdefault(tag, {}).setdefault(code, []).append((pattern, repl))
+        for by_code in compiled.values():
+            for code, rules in by_code.items():
+                by_code[code] = (compile_combined_pattern([pattern for pattern, repl in rules]), rules)
+        self._compiled = compiled
+        return compiled
+
+    def get_tags(self) -> set:
+        """Returns the set of tags the table can edit"""
+        return set(rule[0] for rule in self.rules)
+
+    def edit_field(self, field:pymarc.field.Field) -> bool:
+        """Applies the rules of the field tag to its subfields, returns True if the field changed.
+        Can be used as a FieldDispatchTable handler (it never deletes the field)"""
+        if self._compiled is None:
+            self.compile()
+        by_code = self._compiled.get(field.tag)
+        if by_code is None or field.is_control_field():
+            return False
+        new_subf = None
+        for index, subf in enumerate(read_subfields(field)):
+            code_rules = by_code.get(subf.code)
+            if code_rules is None:
+                continue
+            combined, rules = code_rules
+            # Nothing matches, nothing to edit
+            if combined is not None and combined.search(subf.value) is None:
+                continue
+            value = subf.value
+            for pattern, repl in rules:
+                value = pattern.sub(repl, value)
+            if value == subf.value:
+                continue
+            # The list is only copied for the first edited subfield
+            if new_subf is None:
+                new_subf = list(read_subfields(field))
+            new_subf[index] = subf._replace(value=value)
+        if new_subf is None:
+            return False
+        field.subfields = new_subf
+        return True
+
+    def apply(self, record:pymarc.record.Record) -> int:
+        """Applies the table to the record, returns the number of edited fields"""
+        if self._compiled is None:
+            self.compile()
+        edited = 0
+        if len(self._compiled) == 0:
+            return edited
+        for field in record.get_fields(*self._compiled):
+            if self.edit_field(field):
+                edited += 1
+        if edited > 0:
+            mark_modified(record, self.operation)
+        return edited
+
+    __call__ = apply
+
+def replace_specific_repeatable_subfield_content_not_matching_regexp(field:pymarc.field.Field, codes:List[str], pattern:str|re.Pattern, repl:str, flags:int=0) -> List[pymarc.field.Subfield]:
+    """Replace all subfields of a code by a value if they do not match a regexp.
     Edits the field and also return the subfield list (as pymarc.field.Subfield)
     
     Takes as argument :
         - field : pymarc Field to edit
         - codes : list of codes to edit (str)
-        - pattern : regexp pattern
-        - repl : repalcement text"""
+        - pattern : regexp pattern (str or compiled re.Pattern)
+        - repl : repalcement text
+        - [OPTIONNAL, 0] flags : re flags (only if pattern is a str)"""
     
-    subf_list:List[pymarc.field.Subfield] = field.subfields
+    pattern = compile_pattern(pattern, flags)
+    subf_list:List[pymarc.field.Subfield] = read_subfields(field)
     new_subf = []
+    changed = False
     for subf in subf_list:
         # If right codes, check if the regex match
-        if subf.code in codes:
-            # If no match, rewrite using replacement string
-            if not re.match(pattern, subf.value):
-                new_subf.append(subf._replace(value=repl))
-            # If match, add the unedited subfield
-            else:
-                new_subf.append(subf)
+        # If no match, rewrite using replacement string
+        if subf.code in codes and not pattern.match(subf.value) and subf.value != repl:
+            new_subf.append(subf._replace(value=repl))
+            changed = True
         # Else, add the unedited subfield
         else:
             new_subf.append(subf)
 
-    # Updates the field
-    field.subfields = new_subf
+    # Updates the field (only if needed)
+    if changed:
+        field.subfields = new_subf
     return new_subf
 
-def replace_repeatable_subf_content_not_matching_regexp_for_tag(record:pymarc.record.Record, tag:str, codes:List[str], pattern:str, repl:str):
-    """Replace all subfields of a code by a value if they do not match a regexp (no flag).
+def replace_repeatable_subf_content_not_matching_regexp_for_tag(record:pymarc.record.Record, tag:str, codes:List[str], pattern:str|re.Pattern, repl:str, flags:int=0):
+    """Replace all subfields of a code by a value if they do not match a regexp.
     
     Takes as argument :
         - record : a pymarc record
         - tag : a field tag (str)
         - codes : list of codes to edit (str)
-        - pattern : regexp pattern
-        - repl : repalcement text"""
+        - pattern : regexp pattern (str or compiled re.Pattern)
+        - repl : repalcement text
+        - [OPTIONNAL, 0] flags : re flags (only if pattern is a str)"""
     
+    # Compile once for all fields
+    pattern = compile_pattern(pattern, flags)
+    modified = False
     for field in record.get_fields(tag):
+        old_subf = read_subfields(field)
         replace_specific_repeatable_subfield_content_not_matching_regexp(field, codes, pattern, repl)
+        # The list is only replaced if a subfield changed
+        if read_subfields(field) is not old_subf:
+            modified = True
+    if modified:
+        mark_modified(record, "replace_repeatable_subf_content_not_matching_regexp_for_tag")
+
+class TagFamily(NamedTuple):
+    """Tags of a responsibility family (see TagFamilyNormalizer)"""
+    # Main entry tags, by priority
+    main_tags: Tuple[str, ...]
+    # Main entry tag -> tag given to the main entry fields that are not kept
+    demote: dict
+    # (tag, main entry tag) by priority, used if there is no main entry
+    promote: Tuple[Tuple[str, str], ...] = ()
+
+def get_unimarc_tag_family(prefixes:List[str]) -> TagFamily:
+    """Returns the UNIMARC family of these tag prefixes (e.g. ["70", "71"]) :
+    7X0 are the main entries (by prefix order), 7X1 & 7X2 are promoted to 7X0
+    (all 7X1 first, then all 7X2, by prefix order)
+
+    Takes as argument :
+        - prefixes {list of str} : the first 2 characters of the tags, by priority"""
+    return TagFamily(
+        tuple(prefix + "0" for prefix in prefixes),
+        {prefix + "0": prefix + "1" for prefix in prefixes},
+        tuple((prefix + "1", prefix + "0") for prefix in prefixes) + tuple((prefix + "2", prefix + "0") for prefix in prefixes)
+    )
+
+# MARC 21 main entries, there is no promotion as records with a title main entry have no 1XX
+MARC21_1XX_FAMILY = TagFamily(("100", "110", "111", "130"), {"100": "700", "110": "710", "111": "711", "130": "730"})
+UNIMARC_7XX_FAMILY = get_unimarc_tag_family(["70", "71"])
+UNIMARC_72X_FAMILY = get_unimarc_tag_family(["72"])
+
+class TagFamilyNormalizer:
+    """Makes sure every family of the table has only one main entry, and one main entry
+    if it has promotable fields, in a single pass on the fields of the record.
+    For each family :
+        - if there are main entries, the first field of the main tag with the highest priority is kept,
+    the other ones get their demote tag
+        - else, the first field of the first promote tag found gets its main entry tag
+    Fields keep their position (use sort_fields_by_tag() if needed)
+
+    Takes as argument :
+        - families {list of TagFamily} : a tag can only be in one family
+        - [OPTIONNAL, "TagFamilyNormalizer"] operation {str} : the operation name used for change tracking"""
+
+    def __init__(self, families:List[TagFamily], operation:str="TagFamilyNormalizer"):
+        self.families = [TagFamily(*family) for family in families]
+        self.operation = operation
+        self._families_by_tag = {}
+        self._priorities = []
+        for index, family in enumerate(self.families):
+            for tag in family.main_tags:
+                if not tag in family.demote:
+                    raise ValueError(f"No demote tag for main entry tag {tag}")
+            self._priorities.append({tag: priority for priority, tag in enumerate(family.main_tags)})
+            for tag in list(family.main_tags) + [tag for tag, main_tag in family.promote]:
+                if self._families_by_tag.get(tag, index) != index:
+                    raise ValueError(f"Tag {tag} is in multiple families")
+                self._families_by_tag[tag] = index
+
+    def get_tags(self) -> set:
+        """Returns the set of tags the normalizer can edit"""
+        return set(self._families_by_tag)
+
+    def apply(self, record:pymarc.record.Record) -> int:
+        """Normalizes the record, returns the number of fields with a new tag"""
+        # Single pass : family fields, in record order
+        found = [[] for family in self.families]
+        if len(self._families_by_tag) > 0:
+            for field in record.get_fields(*self._families_by_tag):
+                found[self._families_by_tag[field.tag]].append(field)
+
+        retagged = 0
+        for family, priorities, fields in zip(self.families, self._priorities, found):
+            mains = [field for field in fields if field.tag in priorities]
+            if len(mains) > 0:
+                # min() returns the first field with the highest priority
+                kept = min(mains, key=lambda field: priorities[field.tag])
+                for field in mains:
+                    if field is not kept and set_field_tag(record, field, family.demote[field.tag], self.operation):
+                        retagged += 1
+                continue
+            first_fields = {}
+            for field in fields:
+                first_fields.setdefault(field.tag, field)
+            for tag, main_tag in family.promote:
+                if tag in first_fields:
+                    if set_field_tag(record, first_fields[tag], main_tag, self.operation):
+                        retagged += 1
+                    break
+        return retagged
+
+    __call__ = apply
+
+__FIX_7XX = TagFamilyNormalizer([UNIMARC_7XX_FAMILY], "fix_7XX")
+__FIX_7XX_PRIORITIZE_71X = TagFamilyNormalizer([get_unimarc_tag_family(["71", "70"])], "fix_7XX")
 
 def fix_7XX(record:pymarc.record.Record, prioritize_71X:bool=False):
     """Makes sure that only 1 7X0 is in the record and
@@ -274,41 +1583,15 @@ def fix_7XX(record:pymarc.record.Record, prioritize_71X:bool=False):
         - record : a pymarc record
         - [OPTIONNAL, False] prioritize_71X {bool} : priotize 70X
     instead of 71X"""
-    prio_7X = "70"
-    unprio_7X = "71"
+    # See TagFamilyNormalizer for other tags
     if prioritize_71X:
-        prio_7X = "71"
-        unprio_7X = "70"
-    # if 700 & 710, keep the priotize ones
-    all_7X0 = record.get_fields("700", "710")
-    if len(all_7X0) > 1:
-        # ↓ This is used to make sure we keep the first non prio
-        # as a 0 in case the prio one don't have a 0 field
-        has_prio_7X0 = len(record.get_fields(prio_7X + "0")) > 0
-        first_occ = True
-        for field in all_7X0:
-            # i know I can nest things, but i like this better 
-            if first_occ:
-                if field.tag == unprio_7X + "0" and has_prio_7X0:
-                    field.tag = unprio_7X + "1"
-                elif field.tag == prio_7X + "0":
-                    first_occ = False
-                elif field.tag == unprio_7X + "0" and not has_prio_7X0:
-                    first_occ = False
-            else:
-                field.tag = field.tag[:2] + "1"
-
-    # Checks if there's a 7X0 if 7X1 are in the record
-    if len(record.get_fields("700", "710")) == 0 and len(record.get_fields("701", "711", "702", "712")) > 0:
-        # If there are, get the first field 
-        for tag in [prio_7X + "1", unprio_7X + "1", prio_7X + "2", unprio_7X + "2"]:
-            if len(record.get_fields(tag)) > 0:
-                record.get_fields(tag)[0].tag = record.get_fields(tag)[0].tag[:2] + "0"
-                break
+        __FIX_7XX_PRIORITIZE_71X.apply(record)
+    else:
+        __FIX_7XX.apply(record)
 
 # ------------------------------ Merge ------------------------------
 
-def merge_all_fields_by_tag(record:pymarc.record.Record, tag:str, sort:List[str]=[]) -> pymarc.field.Field|None:
+def merge_all_fields_by_tag(record:pymarc.record.Record, tag:str, sort:List[str]|SortSpec=[]) -> pymarc.field.Field|None:
     """Merge ALL fields with the tag as one, sorting them if wanted
     Edits the record and also returns the new field
     Indicators used are from the first field
@@ -322,26 +1605,88 @@ def merge_all_fields_by_tag(record:pymarc.record.Record, tag:str, sort:List[str]
     Takes as argument :
         - record : the pymarc record
         - tag : the field tag to merge (str)
-        - sort : a list of subfield codes (str)"""
+        - sort : a list of subfield codes (str) or a SortSpec"""
     
+    fields = record.get_fields(tag)
     # Return if no match
-    if record.get_fields(tag) == []:
+    if fields == []:
         return None
     # Create the new field
-    new_field = pymarc.field.Field(tag, record.get_fields(tag)[0].indicators)
+    new_field = pymarc.field.Field(tag, fields[0].indicators)
     # Stores every existing subfield
     curr_subf = []
-    for field in record.get_fields(tag):
-        curr_subf += field.subfields
+    for field in fields:
+        curr_subf += read_subfields(field)
 
     # Sort the subfields    
     new_field.subfields = __sort_subfields(curr_subf, sort)
 
     # Replace current fields by the new one
-    record.remove_fields(tag)
-    record.add_ordered_field(new_field)
+    batch = FieldMutationBatch(record)
+    batch.remove_field(*fields)
+    batch.add_ordered_field(new_field)
+    if batch.commit():
+        mark_modified(record, "merge_all_fields_by_tag")
     return new_field
 
+def merge_fields_by_key(record:pymarc.record.Record, tags:str|List[str], key=None, sort:List[str]|SortSpec=[]) -> List[pymarc.field.Field]:
+    """Merges the fields with the same tag & key as one, sorting them if wanted, in a single pass on the fields.
+    Each group is merged in its first field (same position & indicators), the other fields are removed
+    and the record fields are rebuilt once.
+    Returns the list of fields other fields were merged in
+
+    Sorting : same as merge_all_fields_by_tag(), applied to every field with a key
+
+    Takes as argument :
+        - record : the pymarc record
+        - tags : the field tag or a list of tags to merge
+        - [OPTIONNAL, None] key : a list of subfield codes (their values are the key, fields without any
+    of them are not merged), a function taking the field and returning a hashable key (None to not merge the field),
+    or None to merge all fields with the same tag
+        - [OPTIONNAL, []] sort : a list of subfield codes (str) or a SortSpec"""
+    if isinstance(tags, str):
+        tags = [tags]
+    tags = set(tags)
+    if not isinstance(sort, SortSpec):
+        sort = SortSpec(sort)
+    if key is not None and not callable(key):
+        codes = list(key)
+        def key(field:pymarc.field.Field):
+            view = get_code_view(field)
+            values = tuple(tuple(view.values(code)) for code in codes)
+            return values if any(values) else None
+
+    # Single pass : groups of fields, by tag & key
+    groups = {}
+    for field in record.get_fields(*tags):
+        if field.is_control_field():
+            continue
+        field_key = key(field) if key is not None else ()
+        if field_key is None:
+            continue
+        groups.setdefault((field.tag, field_key), []).append(field)
+
+    merged_fields = []
+    removed = set()
+    modified = False
+    for fields in groups.values():
+        subfields = []
+        for field in fields:
+            subfields += read_subfields(field)
+        subfields = sort.apply(subfields)
+        if subfields != list(read_subfields(fields[0])):
+            fields[0].subfields = subfields
+            modified = True
+        if len(fields) > 1:
+            merged_fields.append(fields[0])
+            removed.update(id(field) for field in fields[1:])
+    if len(removed) > 0:
+        filter_fields(record, lambda field: not id(field) in removed, operation=None, tags=tags)
+        modified = True
+    if modified:
+        mark_modified(record, "merge_fields_by_key")
+    return merged_fields
+
 def merge_all_subfields_with_code(record:pymarc.record.Record, tag:str, code:str, separator:str):
     """Merges all subfields with given code in every field with given tag.
     The position of the first subfield will be kept
@@ -351,28 +1696,38 @@ def merge_all_subfields_with_code(record:pymarc.record.Record, tag:str, code:str
         - tag : the field tag (str)
         - code : the subfield code to merge (str)
         - separator : the separtor to use between subfields (str)"""
+    modified = False
     for field in record.get_fields(tag):
-        value_list = field.get_subfields(code)
-        # If no subfield with this code or only 1, skipp this field
-        if len(value_list) < 2:
+        if __merge_subfields_with_code(field, code, separator):
+            modified = True
+    if modified:
+        mark_modified(record, "merge_all_subfields_with_code")
+
+def __merge_subfields_with_code(field:pymarc.field.Field, code:str, separator:str) -> bool:
+    """Merges all subfields with given code in the field, at the first subfield position.
+    Returns True if subfields were merged"""
+    value_list = get_code_view(field).values(code)
+    # If no subfield with this code or only 1, skipp this field
+    if len(value_list) < 2:
+        return False
+    consummed = False
+    new_subfields = []
+    # Iterate throguh all subfields
+    for subf in read_subfields(field):
+        # Ignore subfield if not the right code
+        if subf.code != code:
+            new_subfields.append(subf)
             continue
-        consummed = False
-        new_subfields = []
-        # Iterate throguh all subfields
-        for subf in field.subfields:
-            # Ignore subfield if not the right code
-            if subf.code != code:
-                new_subfields.append(subf)
-                continue
-            # If first time seeign this subfield, change its value
-            if not consummed:
-                new_subfields.append(pymarc.Subfield(code, separator.join(value_list)))
-                consummed = True
-            # Delete the subfield if not forst occurrence
-            # (Elif to avoid triggerring on 1st field)
-            elif consummed:
-                continue
-        field.subfields = new_subfields
+        # If first time seeign this subfield, change its value
+        if not consummed:
+            new_subfields.append(pymarc.Subfield(code, separator.join(value_list)))
+            consummed = True
+        # Delete the subfield if not forst occurrence
+        # (Elif to avoid triggerring on 1st field)
+        elif consummed:
+            continue
+    field.subfields = new_subfields
+    return True
 
 # ------------------------------ Split ------------------------------
 
@@ -385,30 +1740,31 @@ def split_tags_if_multiple_specific_subfield(record:pymarc.record.Record, tag:st
         - tag : the tag to check (str)
         - code : the code to check (str)"""
     
+    # Fields are added & removed all at once at the end
+    batch = FieldMutationBatch(record)
     for field in record.get_fields(tag):
-        # Leave if there is no subfield with this code
-        if not code in field.subfields_as_dict():
-            continue
-        # Leave if there is only one subfield with this code
-        if len(field.subfields_as_dict()[code]) < 2:
+        view = get_code_view(field)
+        # Leave if there is no subfield with this code or only one
+        if view.count(code) < 2:
             continue
         # Get this subfield values
-        vals = field.subfields_as_dict()[code]
+        vals = view.values(code)
         # Get all other subfield values
         other_subf = []
-        for subf in field.subfields:
+        for subf in read_subfields(field):
             if subf.code != code:
                 other_subf.append(subf)
         # Append new field for each subfield
         for val in vals:
-            # You NEED to copy the list because pymarc doesn't create a copy
-            # 
-            new_field = pymarc.field.Field(tag, field.indicators, subfields=other_subf.copy())
-            new_field.add_subfield(code, val)
-            record.add_ordered_field(new_field)
+            # You NEED a new list because pymarc doesn't create a copy
+            # (built at its final size, instead of copied then appended)
+            new_field = pymarc.field.Field(tag, field.indicators, subfields=other_subf + [pymarc.Subfield(code, val)])
+            batch.add_ordered_field(new_field)
 
         # Delete the original field
-        record.remove_field(field)
+        batch.remove_field(field)
+    if batch.commit():
+        mark_modified(record, "split_tags_if_multiple_specific_subfield")
 
 def split_merged_tags(record:pymarc.record.Record, tag:str):
     """Splits a tag into multiple if there are multiple subfields with the same code.
@@ -418,8 +1774,10 @@ def split_merged_tags(record:pymarc.record.Record, tag:str):
         - record : a pymarc record
         - tag : the tag to check (str)"""
     
+    # Fields are added & removed all at once at the end
+    batch = FieldMutationBatch(record)
     for field in record.get_fields(tag):
-        all_subf = field.subfields_as_dict()
+        all_subf = get_code_view(field).as_dict()
         # Stores the highest number or a repeated subfield
         highest_repeat = 1
         for code in all_subf:
@@ -441,73 +1799,119 @@ def split_merged_tags(record:pymarc.record.Record, tag:str):
                 else:
                     new_field.add_subfield(code, all_subf[code][0])
             # Add the new field to the record
-            record.add_ordered_field(new_field)
+            batch.add_ordered_field(new_field)
 
         # Delete the original field
-        record.remove_field(field)
+        batch.remove_field(field)
+    if batch.commit():
+        mark_modified(record, "split_merged_tags")
 
 # ------------------------------ Delete ------------------------------
+
+def filter_fields(record:pymarc.record.Record, predicate, operation:str|None="filter_fields", tags:List[str]|None=None) -> int:
+    """Only keeps the fields for which predicate returns True, rebuilding the fields list once.
+    Returns the number of deleted fields
     
+    Takes as argument :
+        - record : a pymarc record
+        - predicate : function taking a field and returning False if the field must be deleted
+        - [OPTIONNAL, "filter_fields"] operation {str} : the operation name used for change tracking,
+    None to not mark the record
+        - [OPTIONNAL, None] tags : only checks the fields with one of these tags (list of str),
+    None to check every field. With an IndexedRecord, they are read from the index"""
+    if tags is not None and isinstance(record, IndexedRecord):
+        # Only the checked fields are read, the index is updated on removal
+        deleted = [field for field in record.get_fields(*tags) if not predicate(field)]
+        if len(deleted) > 0:
+            record.remove_field(*deleted)
+        nb_deleted = len(deleted)
+    else:
+        if tags is not None:
+            tags = set(tags)
+            new_fields = [field for field in record.fields if not field.tag in tags or predicate(field)]
+        else:
+            new_fields = [field for field in record.fields if predicate(field)]
+        nb_deleted = len(record.fields) - len(new_fields)
+        # Only replace the list if something changed
+        if nb_deleted > 0:
+            record.fields[:] = new_fields
+    if nb_deleted > 0 and operation is not None:
+        mark_modified(record, operation)
+    return nb_deleted
+
+def filter_subfields(field:pymarc.field.Field, predicate) -> int:
+    """Only keeps the subfields for which predicate returns True, rebuilding the subfields list once.
+    Returns the number of deleted subfields (control fields are ignored)
+    
+    Takes as argument :
+        - field : a pymarc field
+        - predicate : function taking a subfield and returning False if the subfield must be deleted"""
+    # Skip control fields
+    if field.is_control_field():
+        return 0
+    subf_list = read_subfields(field)
+    new_subf_list = [subf for subf in subf_list if predicate(subf)]
+    nb_deleted = len(subf_list) - len(new_subf_list)
+    # Only replace the list if something changed
+    if nb_deleted > 0:
+        field.subfields = new_subf_list
+    return nb_deleted
+
+def __is_not_empty_subfield(subf:pymarc.field.Subfield) -> bool:
+    return subf.value != ""
+
 def delete_empty_subfields(record:pymarc.record.Record):
     "Deletes every empty subfields"
-    for field in record:
-        # Skip control fields
-        if field.is_control_field():
-            continue
-        # If something is empty
-        if "" in __get_all_subfield_values_as_list(field):
-            # Don't use delete subfield, it deletes the first occurrence found
-            new_subf_list = []
-            # Loop thorugh all subfields and copy those with values
-            for subf in field.subfields:
-                if subf.value != "":
-                    new_subf_list.append(subf)
-            # Replace current subfields by the new list
-            field.subfields = new_subf_list
+    nb_deleted = 0
+    for field in record.fields:
+        nb_deleted += filter_subfields(field, __is_not_empty_subfield)
+    if nb_deleted > 0:
+        mark_modified(record, "delete_empty_subfields")
+
+def __is_not_empty_field(field:pymarc.field.Field) -> bool:
+    # Control fields
+    if field.is_control_field():
+        return field.data != ""
+    # Data fields
+    return len(read_subfields(field)) > 0
 
 def delete_empty_fields(record:pymarc.record.Record):
     "Deletes every empty fields"
-    for field in record:
-        # Control fields
-        if field.is_control_field():
-            if field.data == "":
-                record.remove_field(field)
-        # Data fields
-        else:
-            if field.subfields == []:
-                record.remove_field(field)
+    filter_fields(record, __is_not_empty_field, operation="delete_empty_fields")
 
-
-def delete_field_if_all_subfields_match_regexp(record:pymarc.record.Record, tag:str, code:str, pattern:str, keep_if_no_subf:bool=True):
+def delete_field_if_all_subfields_match_regexp(record:pymarc.record.Record, tag:str, code:str, pattern:str|re.Pattern, keep_if_no_subf:bool=True, flags:int=0):
     """For all fields with given tag, delete the entire field if ALL subfields with this code match the regexp.
     
     Takes as argument :
         - record : a pymarc record
         - tag : the tag to check (str)
         - code : the code to check (str)
-        - pattern : the regexp pattern to check
+        - pattern : the regexp pattern to check (str or compiled re.Pattern)
         - [OPTIONNAL, True] keep_if_no_subf : if set to false, deletes the field if
-    no subfield had the code"""
+    no subfield had the code
+        - [OPTIONNAL, 0] flags : re flags (only if pattern is a str)"""
 
-    for field in record.get_fields(tag):
-        # If the field is not here, keep or del (yeah nesting "if" was not necessary but easier to read)
-        # Why do I yap like that ?
-        if not code in field.subfields_as_dict():
-            if keep_if_no_subf:
-                continue
-            else:
-                record.remove_field(field)
-                continue
-        
-        # The field has subfields for this code
-        delete = True
-        for content in field.subfields_as_dict()[code]:
-            # At least one of the subfied does not match, keep the field
-            if not re.match(pattern, content):
-                delete = False
-        
-        if delete:
-            record.remove_field(field)
+    pattern = compile_pattern(pattern, flags)
+    filter_fields(record, lambda field: not __all_subfields_match_regexp(field, code, pattern, keep_if_no_subf), operation="delete_field_if_all_subfields_match_regexp", tags=[tag])
+
+def __all_subfields_match_regexp(field:pymarc.field.Field, code:str, pattern:re.Pattern, keep_if_no_subf:bool=True) -> bool:
+    """Returns True if the field should be deleted by delete_field_if_all_subfields_match_regexp()"""
+    view = get_code_view(field)
+    # If the field is not here, keep or del (yeah nesting "if" was not necessary but easier to read)
+    # Why do I yap like that ?
+    if not view.has(code):
+        if keep_if_no_subf:
+            return False
+        else:
+            return True
+    
+    # The field has subfields for this code
+    delete = True
+    for content in view.values(code):
+        # At least one of the subfied does not match, keep the field
+        if not pattern.match(content):
+            delete = False
+    return delete
 
 
 def delete_multiple_subfield_for_tag(record:pymarc.record.Record, tag:str, code:str):
@@ -518,23 +1922,30 @@ def delete_multiple_subfield_for_tag(record:pymarc.record.Record, tag:str, code:
         - tag : the tag to check (str)
         - code : the code to check (str)"""
     
+    nb_deleted = 0
     for field in record.get_fields(tag):
-        # Leave if there is no subfield with this code
-        if not code in field.subfields_as_dict():
-            continue
-        # Don't use delete subfield, it deletes the first occurrence found
-        first = True
-        new_subf_list = []
-        # Loop thorugh all subfields and copy those with values
-        for subf in field.subfields:
-            if subf.code != code:
-                new_subf_list.append(subf)
-            # Do not merge this elif, you need to set first to false only if it's the first occurrence of THIS subfield
-            elif subf.code == code and first:
-                new_subf_list.append(subf)
-                first = False
-        # Replace current subfields by the new list
-        field.subfields = new_subf_list
+        nb_deleted += __delete_multiple_subfield(field, code)
+    if nb_deleted > 0:
+        mark_modified(record, "delete_multiple_subfield_for_tag")
+
+def __delete_multiple_subfield(field:pymarc.field.Field, code:str) -> int:
+    """Only keeps the first subfield with this code in the field.
+    Returns the number of deleted subfields"""
+    # Leave if there is no subfield with this code or only one
+    if get_code_view(field).count(code) < 2:
+        return 0
+    # Don't use delete subfield, it deletes the first occurrence found
+    first = True
+    def keep(subf:pymarc.field.Subfield) -> bool:
+        nonlocal first
+        if subf.code != code:
+            return True
+        # Do not merge this, you need to set first to false only if it's the first occurrence of THIS subfield
+        if first:
+            first = False
+            return True
+        return False
+    return filter_subfields(field, keep)
 
 def delete_all_subfields_with_code_from_field(record:pymarc.record.Record, tag:str, code:str):
     """Delete all subfields with this code of all fields with this tag
@@ -543,9 +1954,630 @@ def delete_all_subfields_with_code_from_field(record:pymarc.record.Record, tag:s
         - record : a pymarc record
         - tag : the tag to edit (str)
         - code : the code to delete (str)"""
+    if delete_subfields(record, tag, [code], operation=None)[code] > 0:
+        mark_modified(record, "delete_all_subfields_with_code_from_field")
+
+def __delete_all_subfields_with_code(field:pymarc.field.Field, code:str) -> int:
+    """Delete all subfields with this code in the field.
+    Returns the number of deleted subfields"""
+    if not get_code_view(field).has(code):
+        return 0
+    return filter_subfields(field, lambda subf: subf.code != code)
+
+def delete_subfields(record:pymarc.record.Record, tag:str, codes:List[str], predicate=None, operation:str|None="delete_subfields") -> dict:
+    """Delete all subfields with one of these codes of all fields with this tag, in a single pass on each field.
+    Returns a dict with, for each code, the number of deleted subfields
+    
+    Takes as argument :
+        - record : a pymarc record
+        - tag : the tag to edit (str)
+        - codes : list of codes to delete (str)
+        - [OPTIONNAL, None] predicate : function taking a subfield, if set, only deletes
+    the subfields for which it returns True
+        - [OPTIONNAL, "delete_subfields"] operation {str} : the operation name used for change tracking,
+    None to not mark the record"""
+    counts = {code: 0 for code in codes}
+    def keep(subf:pymarc.field.Subfield) -> bool:
+        if not subf.code in counts:
+            return True
+        if predicate is not None and not predicate(subf):
+            return True
+        counts[subf.code] += 1
+        return False
+
     for field in record.get_fields(tag):
-        for ii in range(0, len(field.get_subfields(code))):
-            field.delete_subfield(code)
+        view = get_code_view(field)
+        # Skip fields without any of the codes
+        for code in counts:
+            if view.has(code):
+                filter_subfields(field, keep)
+                break
+    if operation is not None and sum(counts.values()) > 0:
+        mark_modified(record, operation)
+    return counts
+
+def __normalize_value(value:str, casefold:bool, strip:bool) -> str:
+    if strip:
+        value = value.strip()
+    if casefold:
+        value = value.casefold()
+    return value
+
+def get_dedupe_key(field:pymarc.field.Field, casefold:bool=False, strip:bool=False) -> tuple:
+    """Returns the key used by dedupe_fields() : tag, indicators & subfields (or data),
+    values normalized if wanted
+
+    Takes as argument :
+        - field : a pymarc field
+        - [OPTIONNAL, False] casefold {bool} : compare values ignoring case
+        - [OPTIONNAL, False] strip {bool} : compare values ignoring surrounding whitespaces"""
+    if not casefold and not strip:
+        return get_field_snapshot(field)
+    if field.is_control_field():
+        return (field.tag, __normalize_value(field.data or "", casefold, strip))
+    return (field.tag, tuple(field.indicators), tuple((subf.code, __normalize_value(subf.value, casefold, strip)) for subf in read_subfields(field)))
+
+def dedupe_fields(record:pymarc.record.Record, tags:str|List[str]|None=None, key=None, casefold:bool=False, strip:bool=False) -> int:
+    """Deletes the duplicated fields, keeping the first occurrence, in a single pass on the fields.
+    Fields are duplicates if they have the same tag, indicators & subfields (or data for control fields).
+    Returns the number of deleted fields
+
+    Takes as argument :
+        - record : a pymarc record
+        - [OPTIONNAL, None] tags : the field tag or a list of tags to check, None for every field
+        - [OPTIONNAL, None] key : function taking a field and returning a hashable key
+    (None to keep the field), fields with the same key are duplicates. Defaults to get_dedupe_key()
+        - [OPTIONNAL, False] casefold {bool} : compare values ignoring case (default key only)
+        - [OPTIONNAL, False] strip {bool} : compare values ignoring surrounding whitespaces (default key only)"""
+    if isinstance(tags, str):
+        tags = [tags]
+    if tags is not None:
+        tags = set(tags)
+    if key is None:
+        key = lambda field: get_dedupe_key(field, casefold, strip)
+    seen = set()
+    def keep(field:pymarc.field.Field) -> bool:
+        field_key = key(field)
+        if field_key is None:
+            return True
+        if field_key in seen:
+            return False
+        seen.add(field_key)
+        return True
+
+    return filter_fields(record, keep, operation="dedupe_fields", tags=tags)
+
+def __dedupe_field_subfields(field:pymarc.field.Field, codes:List[str]|None, casefold:bool, strip:bool) -> int:
+    """Deletes the duplicated subfields of a field, returns the number of deleted subfields"""
+    seen = set()
+    def keep(subf:pymarc.field.Subfield) -> bool:
+        if codes is not None and not subf.code in codes:
+            return True
+        subf_key = (subf.code, __normalize_value(subf.value, casefold, strip))
+        if subf_key in seen:
+            return False
+        seen.add(subf_key)
+        return True
+    return filter_subfields(field, keep)
+
+def dedupe_subfields(record:pymarc.record.Record, tag:str, codes:List[str]|None=None, casefold:bool=False, strip:bool=False) -> int:
+    """Deletes the duplicated subfields (same code & value) in every field with this tag,
+    keeping the first occurrence, in a single pass on each field.
+    Returns the number of deleted subfields
+
+    Takes as argument :
+        - record : a pymarc record
+        - tag : the field tag (str)
+        - [OPTIONNAL, None] codes : list of subfield codes to check, None for every subfield
+        - [OPTIONNAL, False] casefold {bool} : compare values ignoring case
+        - [OPTIONNAL, False] strip {bool} : compare values ignoring surrounding whitespaces"""
+    if codes is not None:
+        codes = set(codes)
+    nb_deleted = 0
+    for field in record.get_fields(tag):
+        nb_deleted += __dedupe_field_subfields(field, codes, casefold, strip)
+    if nb_deleted > 0:
+        mark_modified(record, "dedupe_subfields")
+    return nb_deleted
+
+# ------------------------------ Transformation plan ------------------------------
+
+class FieldDispatchTable:
+    """Per-tag table of field handlers, applied to a record in a single pass on its fields.
+    A handler takes a field, edits it and returns False if the field must be deleted (True otherwise).
+    Handlers registered with None as the tag are applied to every field.
+    For each field, handlers are called in the order they were added.
+    If the record is tracked (see track_changes()), fields are compared before and after
+    each handler to mark the record as modified by the handler name"""
+
+    def __init__(self):
+        self._handlers = []
+        self._by_tag = {}
+        self._names = {}
+
+    def __len__(self) -> int:
+        return len(self._handlers)
+
+    def add(self, tag:str|None, handler, name:str|None=None):
+        """Adds a handler for this tag (or every field if None).
+        name is the operation name used for change tracking (defaults to the handler name)"""
+        self._handlers.append((tag, handler))
+        self._names[id(handler)] = name if name is not None else getattr(handler, "__name__", "handler")
+        # Resets the table
+        self._by_tag = {}
+
+    def get_handlers(self, tag:str) -> list:
+        """Returns the ordered list of handlers for this tag"""
+        handlers = self._by_tag.get(tag)
+        if handlers is None:
+            handlers = [handler for handler_tag, handler in self._handlers if handler_tag is None or handler_tag == tag]
+            self._by_tag[tag] = handlers
+        return handlers
+
+    def _apply_tracked(self, record:pymarc.record.Record):
+        """Same as apply() but marks the record with the name of every handler that changed a field"""
+        kept_fields = []
+        has_deleted = False
+        for field in record.fields:
+            keep = True
+            for handler in self.get_handlers(field.tag):
+                before = get_field_snapshot(field)
+                if not handler(field):
+                    mark_modified(record, self._names[id(handler)])
+                    keep = False
+                    break
+                if get_field_snapshot(field) != before:
+                    mark_modified(record, self._names[id(handler)])
+            if keep:
+                kept_fields.append(field)
+            else:
+                has_deleted = True
+        if has_deleted:
+            record.fields[:] = kept_fields
+
+    def apply(self, record:pymarc.record.Record):
+        """Applies the handlers to every field of the record.
+        The field list is only rebuilt if a field is deleted"""
+        if is_tracked(record):
+            self._apply_tracked(record)
+            return
+        kept_fields = []
+        has_deleted = False
+        for field in record.fields:
+            keep = True
+            for handler in self.get_handlers(field.tag):
+                if not handler(field):
+                    keep = False
+                    break
+            if keep:
+                kept_fields.append(field)
+            else:
+                has_deleted = True
+        if has_deleted:
+            record.fields[:] = kept_fields
+
+    __call__ = apply
+
+def __plan_sort_subfields_for_tag(tag:str, sort:List[str]|SortSpec):
+    if not isinstance(sort, SortSpec):
+        sort = SortSpec(sort)
+    def handler(field:pymarc.field.Field) -> bool:
+        new_subf = __sort_subfields(read_subfields(field), sort)
+        if new_subf != list(read_subfields(field)):
+            field.subfields = new_subf
+        return True
+    return tag, handler
+
+def __plan_force_indicators(tag:str, ind1:str=None, ind2:str=None):
+    def handler(field:pymarc.field.Field) -> bool:
+        __force_field_indicators(field, ind1, ind2)
+        return True
+    return tag, handler
+
+def __plan_add_missing_subfield_to_field(tag:str, code:str, val:str, pos:int=999):
+    def handler(field:pymarc.field.Field) -> bool:
+        __add_missing_subfield(field, code, val, pos)
+        return True
+    return tag, handler
+
+def __plan_edit_repeatable_subf_content_with_regexp_for_tag(tag:str, codes:List[str], pattern:str|re.Pattern, repl:str, flags:int=0):
+    pattern = compile_pattern(pattern, flags)
+    def handler(field:pymarc.field.Field) -> bool:
+        edit_specific_repeatable_subfield_content_with_regexp(field, codes, pattern, repl)
+        return True
+    return tag, handler
+
+def __plan_replace_repeatable_subf_content_not_matching_regexp_for_tag(tag:str, codes:List[str], pattern:str|re.Pattern, repl:str, flags:int=0):
+    pattern = compile_pattern(pattern, flags)
+    def handler(field:pymarc.field.Field) -> bool:
+        replace_specific_repeatable_subfield_content_not_matching_regexp(field, codes, pattern, repl)
+        return True
+    return tag, handler
+
+def __plan_merge_all_subfields_with_code(tag:str, code:str, separator:str):
+    def handler(field:pymarc.field.Field) -> bool:
+        __merge_subfields_with_code(field, code, separator)
+        return True
+    return tag, handler
+
+def __plan_delete_empty_subfields():
+    def handler(field:pymarc.field.Field) -> bool:
+        filter_subfields(field, __is_not_empty_subfield)
+        return True
+    return None, handler
+
+def __plan_delete_empty_fields():
+    return None, __is_not_empty_field
+
+def __plan_delete_field_if_all_subfields_match_regexp(tag:str, code:str, pattern:str|re.Pattern, keep_if_no_subf:bool=True, flags:int=0):
+    pattern = compile_pattern(pattern, flags)
+    def handler(field:pymarc.field.Field) -> bool:
+        return not __all_subfields_match_regexp(field, code, pattern, keep_if_no_subf)
+    return tag, handler
+
+def __plan_delete_multiple_subfield_for_tag(tag:str, code:str):
+    def handler(field:pymarc.field.Field) -> bool:
+        __delete_multiple_subfield(field, code)
+        return True
+    return tag, handler
+
+def __plan_delete_all_subfields_with_code_from_field(tag:str, code:str):
+    def handler(field:pymarc.field.Field) -> bool:
+        __delete_all_subfields_with_code(field, code)
+        return True
+    return tag, handler
+
+def __plan_delete_subfields(tag:str, codes:List[str], predicate=None):
+    def keep(subf:pymarc.field.Subfield) -> bool:
+        return not subf.code in codes or (predicate is not None and not predicate(subf))
+    def handler(field:pymarc.field.Field) -> bool:
+        filter_subfields(field, keep)
+        return True
+    return tag, handler
+
+def __plan_dedupe_subfields(tag:str, codes:List[str]|None=None, casefold:bool=False, strip:bool=False):
+    if codes is not None:
+        codes = set(codes)
+    def handler(field:pymarc.field.Field) -> bool:
+        __dedupe_field_subfields(field, codes, casefold, strip)
+        return True
+    return tag, handler
+
+# Operations only editing (or deleting) the fields with their tag, run in a single pass on the fields
+# Takes the same arguments as the function minus the record, returns (tag, handler)
+TRANSFORM_PLAN_FIELD_OPERATIONS = {
+    "sort_subfields_for_tag": __plan_sort_subfields_for_tag,
+    "force_indicators": __plan_force_indicators,
+    "add_missing_subfield_to_field": __plan_add_missing_subfield_to_field,
+    "edit_repeatable_subf_content_with_regexp_for_tag": __plan_edit_repeatable_subf_content_with_regexp_for_tag,
+    "replace_repeatable_subf_content_not_matching_regexp_for_tag": __plan_replace_repeatable_subf_content_not_matching_regexp_for_tag,
+    "merge_all_subfields_with_code": __plan_merge_all_subfields_with_code,
+    "delete_empty_subfields": __plan_delete_empty_subfields,
+    "delete_empty_fields": __plan_delete_empty_fields,
+    "delete_field_if_all_subfields_match_regexp": __plan_delete_field_if_all_subfields_match_regexp,
+    "delete_multiple_subfield_for_tag": __plan_delete_multiple_subfield_for_tag,
+    "delete_all_subfields_with_code_from_field": __plan_delete_all_subfields_with_code_from_field,
+    "delete_subfields": __plan_delete_subfields,
+    "dedupe_subfields": __plan_dedupe_subfields
+}
+
+# Operations moving or creating fields, they are applied on the whole record between two passes
+TRANSFORM_PLAN_RECORD_OPERATIONS = {
+    "sort_fields_by_tag": sort_fields_by_tag,
+    "fix_7XX": fix_7XX,
+    "merge_all_fields_by_tag": merge_all_fields_by_tag,
+    "merge_fields_by_key": merge_fields_by_key,
+    "dedupe_fields": dedupe_fields,
+    "split_tags_if_multiple_specific_subfield": split_tags_if_multiple_specific_subfield,
+    "split_merged_tags": split_merged_tags
+}
+
+class TransformPlan:
+    """Ordered list of marc_utils operations, compiled once and applied to many records.
+    Consecutive operations editing fields are grouped in a per-tag dispatch table (FieldDispatchTable)
+    so every field is visited once, operations moving or creating fields are applied on their own
+    between those passes.
+    The result is the same as calling the functions one after another.
+
+    Takes as argument :
+        - [OPTIONNAL] operations : list of tuples (function name or function, *args),
+    the last value of the tuple can be a dict of keyword arguments. Record is never given"""
+
+    # Set by enable_instrumentation() : function wrapping a field handler to count it under its operation name
+    _instrument_handler = None
+
+    def __init__(self, operations:List[tuple]=[]):
+        self.operations = []
+        self._stages = None
+        self._compiled_for = None
+        for operation in operations:
+            args = list(operation[1:])
+            kwargs = {}
+            if len(args) > 0 and isinstance(args[-1], dict):
+                kwargs = args.pop()
+            self.add(operation[0], *args, **kwargs)
+
+    def __len__(self) -> int:
+        return len(self.operations)
+
+    def __getstate__(self) -> dict:
+        # Compiled stages are closures, they are rebuilt after unpickling (e.g. in worker processes)
+        return {"operations": self.operations, "_stages": None, "_compiled_for": None}
+
+    def add(self, name, *args, **kwargs):
+        """Adds an operation at the end of the plan and returns the plan.
+        name can be the function name or the function itself, args & kwargs are the function
+        arguments minus the record"""
+        if callable(name):
+            name = name.__name__
+        if not name in TRANSFORM_PLAN_FIELD_OPERATIONS and not name in TRANSFORM_PLAN_RECORD_OPERATIONS:
+            raise ValueError(f"Unknown operation for a TransformPlan : {name}")
+        self.operations.append((name, args, kwargs))
+        self._stages = None
+        return self
+
+    def compile(self) -> list:
+        """Compiles the plan as a list of stages (callables taking the record) and returns it.
+        Done automatically on first apply(), and again when the instrumentation is enabled or disabled"""
+        stages = []
+        curr_table = None
+        instrument_handler = TransformPlan._instrument_handler
+        for name, args, kwargs in self.operations:
+            if name in TRANSFORM_PLAN_RECORD_OPERATIONS:
+                func = TRANSFORM_PLAN_RECORD_OPERATIONS[name]
+                stages.append(lambda record, func=func, args=args, kwargs=kwargs: func(record, *args, **kwargs))
+                curr_table = None
+                continue
+            if curr_table is None:
+                curr_table = FieldDispatchTable()
+                stages.append(curr_table)
+            tag, handler = TRANSFORM_PLAN_FIELD_OPERATIONS[name](*args, **kwargs)
+            if instrument_handler is not None:
+                handler = instrument_handler(name, handler)
+            curr_table.add(tag, handler, name=name)
+        self._stages = stages
+        self._compiled_for = instrument_handler
+        return stages
+
+    def get_tags(self) -> set|None:
+        """Returns the set of tags the plan can edit,
+        or None if an operation can edit any field (e.g. delete_empty_fields)"""
+        tags = set()
+        for name, args, kwargs in self.operations:
+            if name in TRANSFORM_PLAN_FIELD_OPERATIONS:
+                tag = TRANSFORM_PLAN_FIELD_OPERATIONS[name](*args, **kwargs)[0]
+            elif name == "fix_7XX":
+                tags.update(["700", "701", "702", "710", "711", "712"])
+                continue
+            elif name in ["merge_all_fields_by_tag", "split_tags_if_multiple_specific_subfield", "split_merged_tags"]:
+                tag = kwargs["tag"] if "tag" in kwargs else args[0]
+            elif name in ["merge_fields_by_key", "dedupe_fields"]:
+                tag = kwargs["tags"] if "tags" in kwargs else (args[0] if len(args) > 0 else None)
+                if tag is None:
+                    return None
+                tags.update([tag] if isinstance(tag, str) else tag)
+                continue
+            else:
+                tag = None
+            if tag is None:
+                return None
+            tags.add(tag)
+        return tags
+
+    def apply(self, record:pymarc.record.Record) -> pymarc.record.Record:
+        """Applies the plan to the record, edits it and also returns it"""
+        # Stages keep the (instrumented or not) functions they were compiled with
+        if self._stages is None or self._compiled_for is not TransformPlan._instrument_handler:
+            self.compile()
+        for stage in self._stages:
+            stage(record)
+        return record
+
+    __call__ = apply
+
+# ------------------------------ Rules ------------------------------
+
+class RuleCondition(NamedTuple):
+    """A compiled rule condition (see compile_rule_condition())"""
+    # Set of 001 the record must have (None if any)
+    control_numbers: frozenset|None
+    # Tags the record must have
+    tags: Tuple[str, ...]
+    # Function taking the record and the set of its tags, None if nothing else is checked
+    check: object
+
+def __get_control_number(record:pymarc.record.Record) -> str|None:
+    for field in record.fields:
+        if field.tag == "001":
+            return field.data
+    return None
+
+def __compile_condition_check(condition):
+    """Returns a function taking the record and the set of its tags, and returning if the condition is True"""
+    # Custom predicate
+    if callable(condition):
+        return lambda record, tags: condition(record)
+    # List of conditions : all must be True
+    if isinstance(condition, list):
+        checks = [__compile_condition_check(sub_condition) for sub_condition in condition]
+        return lambda record, tags: all(check(record, tags) for check in checks)
+    name = condition[0]
+    if name == "control_number":
+        control_numbers = __as_frozenset(condition[1])
+        return lambda record, tags: __get_control_number(record) in control_numbers
+    if name == "has_tag":
+        tag = condition[1]
+        return lambda record, tags: tag in tags
+    if name == "leader":
+        position, values = condition[1], condition[2]
+        return lambda record, tags: str(record.leader)[position:position+1] in values if len(str(record.leader)) > position else False
+    if name == "subfield_match":
+        tag, code = condition[1], condition[2]
+        pattern = compile_pattern(condition[3], condition[4] if len(condition) > 4 else 0)
+        def check(record:pymarc.record.Record, tags:set) -> bool:
+            if not tag in tags:
+                return False
+            for field in record.get_fields(tag):
+                for value in get_code_view(field).values(code):
+                    if pattern.match(value):
+                        return True
+            return False
+        return check
+    if name == "not":
+        sub_check = __compile_condition_check(condition[1])
+        return lambda record, tags: not sub_check(record, tags)
+    if name == "any":
+        checks = [__compile_condition_check(sub_condition) for sub_condition in condition[1]]
+        return lambda record, tags: any(check(record, tags) for check in checks)
+    raise ValueError(f"Unknown rule condition : {name}")
+
+def __as_frozenset(values) -> frozenset:
+    if isinstance(values, str):
+        return frozenset([values])
+    return frozenset(values)
+
+def compile_rule_condition(condition) -> RuleCondition:
+    """Compiles a rule condition, control number & tag conditions at the top level are extracted
+    so the rule can be found with a hash lookup.
+    A condition is None (always True), a callable taking the record, a list of conditions (all must be True)
+    or a tuple :
+        - ("control_number", 001 or list of 001)
+        - ("has_tag", tag)
+        - ("leader", position, str or list of allowed values)
+        - ("subfield_match", tag, code, pattern[, flags]) : a subfield matches the regexp (re.match)
+        - ("not", condition)
+        - ("any", list of conditions) : at least one is True"""
+    if condition is None:
+        conditions = []
+    elif isinstance(condition, list):
+        conditions = condition
+    else:
+        conditions = [condition]
+    control_numbers = None
+    tags = []
+    others = []
+    for sub_condition in conditions:
+        if isinstance(sub_condition, tuple) and sub_condition[0] == "control_number":
+            if control_numbers is None:
+                control_numbers = __as_frozenset(sub_condition[1])
+            else:
+                control_numbers = control_numbers & __as_frozenset(sub_condition[1])
+        elif isinstance(sub_condition, tuple) and sub_condition[0] == "has_tag":
+            tags.append(sub_condition[1])
+        else:
+            others.append(sub_condition)
+    check = None
+    if len(others) > 0:
+        check = __compile_condition_check(others)
+    return RuleCondition(control_numbers, tuple(tags), check)
+
+def get_rule_context(record:pymarc.record.Record) -> Tuple[str|None, set]:
+    """Returns the 001 and the set of tags of a record, computed in a single pass on its fields"""
+    control_number = None
+    tags = set()
+    for field in record.fields:
+        tags.add(field.tag)
+        if control_number is None and field.tag == "001":
+            control_number = field.data
+    return control_number, tags
+
+class RuleSet:
+    """Ordered list of rules, each rule being a condition guarding operations.
+    Rules are indexed by 001 (if their condition checks it) or by tag (if it requires a tag), so
+    for a record, only the rules that can match are checked, whatever the number of rules.
+    The 001 & the tags of the record are computed once for all rules, and every condition is checked
+    on the record before any rule is applied. Matching rules are then applied in order.
+
+    Takes as argument :
+        - [OPTIONNAL] rules : list of tuples (condition, list of operations), see add()"""
+
+    def __init__(self, rules:List[tuple]=[]):
+        self.rules = []
+        self._by_control_number = None
+        for condition, operations in rules:
+            self.add(condition, *operations)
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def __getstate__(self) -> dict:
+        # Compiled conditions can be lambdas, they are rebuilt after unpickling
+        return {"rules": self.rules, "_by_control_number": None}
+
+    def add(self, condition, *operations):
+        """Adds a rule at the end and returns the rule set.
+        condition : see compile_rule_condition()
+        operations : TransformPlan operation tuples (function name or function, *args[, kwargs dict])
+    or functions taking the record"""
+        self.rules.append((condition, operations))
+        self._by_control_number = None
+        return self
+
+    def compile(self):
+        """Compiles the conditions and the operations. Done automatically on first apply()"""
+        self._conditions = []
+        self._actions = []
+        self._by_control_number = {}
+        self._by_tag = {}
+        self._general = []
+        for index, (condition, operations) in enumerate(self.rules):
+            compiled = compile_rule_condition(condition)
+            self._conditions.append(compiled)
+            # Consecutive operation tuples are grouped in a TransformPlan
+            actions = []
+            for operation in operations:
+                if isinstance(operation, tuple):
+                    if len(actions) == 0 or not isinstance(actions[-1], TransformPlan):
+                        actions.append(TransformPlan())
+                    args = list(operation[1:])
+                    kwargs = {}
+                    if len(args) > 0 and isinstance(args[-1], dict):
+                        kwargs = args.pop()
+                    actions[-1].add(operation[0], *args, **kwargs)
+                else:
+                    actions.append(operation)
+            self._actions.append(actions)
+            # Index
+            if compiled.control_numbers is not None:
+                for control_number in compiled.control_numbers:
+                    self._by_control_number.setdefault(control_number, []).append(index)
+            elif len(compiled.tags) > 0:
+                self._by_tag.setdefault(compiled.tags[0], []).append(index)
+            else:
+                self._general.append(index)
+
+    def get_matching_rules(self, record:pymarc.record.Record) -> List[int]:
+        """Returns the indexes of the rules matching the record, in order"""
+        if self._by_control_number is None:
+            self.compile()
+        control_number, tags = get_rule_context(record)
+        candidates = list(self._general)
+        if control_number is not None:
+            candidates += self._by_control_number.get(control_number, [])
+        for tag in tags:
+            candidates += self._by_tag.get(tag, [])
+        if len(candidates) == 0:
+            return []
+        candidates.sort()
+        matching = []
+        for index in candidates:
+            condition = self._conditions[index]
+            if any(not tag in tags for tag in condition.tags):
+                continue
+            if condition.check is not None and not condition.check(record, tags):
+                continue
+            matching.append(index)
+        return matching
+
+    def apply(self, record:pymarc.record.Record) -> List[int]:
+        """Applies the matching rules to the record and returns their indexes"""
+        matching = self.get_matching_rules(record)
+        for index in matching:
+            for action in self._actions[index]:
+                action(record)
+        return matching
+
+    __call__ = apply
 
 # ------------------------------ Debug ------------------------------
 
@@ -555,7 +2587,7 @@ def field_as_string(field:pymarc.field.Field) -> str:
     if field.control_field:
         return f"{field.tag} {field.data}"
     subf_as_string = []
-    for subf in field.subfields:
+    for subf in read_subfields(field):
         subf_as_string.append("$" + subf.code + subf.value)
     ind1 = field.indicator1
     if ind1 == " ":
@@ -571,4 +2603,430 @@ def record_as_string(record:pymarc.record.Record) -> str:
     fields_as_string = []
     for field in record.fields:
         fields_as_string.append(field_as_string(field))
-    return "\n".join(fields_as_string)
\ No newline at end of file
+    return "\n".join(fields_as_string)
+
+# ------------------------------ WinIBW text files ------------------------------
+
+def write_field_as_string(file, field:pymarc.field.Field, escape:bool=False):
+    """Writes the field in WinIBW style (same as field_as_string()) and a line break in a text file,
+    without building the string first.
+    /!\\ This means that blank indicators are turned to #
+
+    Takes as argument :
+        - file : a text file opened in write mode
+        - field : a pymarc field
+        - [OPTIONNAL, False] escape {bool} : write $ in values as $$ so read_records_as_string() can read them back"""
+    file.write(field.tag)
+    file.write(" ")
+    if field.control_field:
+        file.write(field.data)
+        file.write("\n")
+        return
+    file.write("#" if field.indicator1 == " " else field.indicator1)
+    file.write("#" if field.indicator2 == " " else field.indicator2)
+    for subf in read_subfields(field):
+        file.write("$")
+        file.write(subf.code)
+        file.write(subf.value.replace("$", "$$") if escape else subf.value)
+    file.write("\n")
+
+def write_record_as_string(file, record:pymarc.record.Record, escape:bool=False, leader:bool=False):
+    """Writes the record in WinIBW style (same as record_as_string()) in a text file,
+    followed by an empty line to separate it from the next record.
+    /!\\ This means that blank indicators are turned to #
+
+    Takes as argument :
+        - file : a text file opened in write mode
+        - record : a pymarc record
+        - [OPTIONNAL, False] escape {bool} : write $ in values as $$ so read_records_as_string() can read them back
+        - [OPTIONNAL, False] leader {bool} : also write the leader as a LDR line"""
+    if leader:
+        file.write("LDR ")
+        file.write(str(record.leader))
+        file.write("\n")
+    for field in record.fields:
+        write_field_as_string(file, field, escape)
+    file.write("\n")
+
+def write_records_as_string(file, records:Iterable[pymarc.record.Record], escape:bool=False, leader:bool=False) -> int:
+    """Writes all records in WinIBW style in a text file (see write_record_as_string()).
+    None records are ignored. Returns the number of written records
+
+    Takes as argument :
+        - file : a text file opened in write mode (use a buffered one)
+        - records : an iterable of pymarc records
+        - [OPTIONNAL, False] escape {bool} : write $ in values as $$ so read_records_as_string() can read them back
+        - [OPTIONNAL, False] leader {bool} : also write the leader as a LDR line"""
+    nb_records = 0
+    for record in records:
+        if record is None:
+            continue
+        write_record_as_string(file, record, escape, leader)
+        nb_records += 1
+    return nb_records
+
+def field_from_string(line:str, unescape:bool=False) -> pymarc.field.Field:
+    """Returns the pymarc field from a line in WinIBW style (# indicators are turned to blanks).
+    Tags under 010 are control fields.
+    Raises a ValueError if the line is not a field
+
+    Takes as argument :
+        - line {str} : the field as a string (without line break)
+        - [OPTIONNAL, False] unescape {bool} : read $$ in values as $"""
+    if len(line) < 4 or line[3] != " ":
+        raise ValueError(f"Not a WinIBW field : {line!r}")
+    tag = line[:3]
+    content = line[4:]
+    # Control fields
+    if tag.isdigit() and tag < "010":
+        return pymarc.field.Field(tag=tag, data=content)
+    if len(content) < 2 or (len(content) > 2 and content[2] != "$"):
+        raise ValueError(f"Not a WinIBW field : {line!r}")
+    ind1 = " " if content[0] == "#" else content[0]
+    ind2 = " " if content[1] == "#" else content[1]
+    subfields = []
+    if unescape:
+        # Splits on single $ only, $$ being a $ in the value
+        parts = [part.replace("\0", "$") for part in content[3:].replace("$$", "\0").split("$")]
+    else:
+        parts = content[3:].split("$")
+    if len(content) > 2:
+        for part in parts:
+            if part == "":
+                raise ValueError(f"Empty subfield code in WinIBW field : {line!r}")
+            subfields.append(pymarc.Subfield(part[0], part[1:]))
+    return pymarc.field.Field(tag, pymarc.field.Indicators(ind1, ind2), subfields)
+
+def read_records_as_string(file, unescape:bool=False, force_utf8:bool=True):
+    """Yields pymarc records from a text file in WinIBW style (as written by write_records_as_string()),
+    one record at a time so the file can be larger than memory.
+    Records are separated by empty lines, a LDR line sets the record leader.
+    Raises a ValueError with the line number if a line is not a field
+
+    Takes as argument :
+        - file : a text file opened in read mode
+        - [OPTIONNAL, False] unescape {bool} : read $$ in values as $
+        - [OPTIONNAL, True] force_utf8 {bool} : same as pymarc Record"""
+    record = None
+    for line_nb, line in enumerate(file, 1):
+        line = line.rstrip("\r\n")
+        # End of a record
+        if line == "":
+            if record is not None:
+                yield record
+                record = None
+            continue
+        if record is None:
+            record = pymarc.record.Record(force_utf8=force_utf8)
+        if line.startswith("LDR "):
+            record.leader = pymarc.leader.Leader(line[4:])
+            continue
+        try:
+            record.add_field(field_from_string(line, unescape))
+        except ValueError as exc:
+            raise ValueError(f"Line {line_nb} : {exc}") from None
+    if record is not None:
+        yield record
+
+# ------------------------------ Instrumentation ------------------------------
+
+# Original functions & methods replaced by enable_instrumentation(), (owner, attribute) -> original
+__INSTRUMENTED = {}
+# Counters, function name -> dict (see get_instrumentation_snapshot())
+__INSTRUMENTATION_COUNTERS = {}
+__INSTRUMENTATION_COUNTER_NAMES = ["fields_scanned", "fields_added", "fields_removed", "fields_modified",
+    "subfields_added", "subfields_removed", "subfields_modified"]
+# Depth of instrumented calls in each thread, only the outermost call is counted
+__INSTRUMENTATION_STATE = threading.local()
+# Snapshot content of a LazyField not decoded yet
+__UNDECODED = object()
+# Those are never instrumented (get_field_snapshot() is used by the instrumentation itself,
+# change tracking functions are called by every mutator & helpers are called by other functions for each field)
+__NOT_INSTRUMENTED = ["get_field_snapshot", "get_record_snapshot", "read_subfields", "get_code_view", "filter_subfields",
+    "compile_pattern", "set_field_tag", "get_dedupe_key", "track_changes", "is_tracked", "mark_modified", "is_modified",
+    "get_changes", "untrack_changes", "enable_instrumentation", "disable_instrumentation", "is_instrumentation_enabled",
+    "reset_instrumentation", "get_instrumentation_snapshot", "merge_instrumentation_snapshots", "export_instrumentation"]
+
+def __new_instrumentation_counter(with_time:bool=True) -> dict:
+    counter = {name: 0 for name in __INSTRUMENTATION_COUNTER_NAMES}
+    if with_time:
+        counter.update({"calls": 0, "total_s": 0.0, "max_s": 0.0, "tags": {}})
+    return counter
+
+def __add_to_instrumentation_counter(counter:dict, tag:str, name:str, nb:int=1):
+    """Adds nb to the counter and to its tag breakdown"""
+    counter[name] += nb
+    if not tag in counter["tags"]:
+        counter["tags"][tag] = __new_instrumentation_counter(False)
+    counter["tags"][tag][name] += nb
+
+def __count_subfield_changes(counter:dict, tag:str, old_subfields:tuple, new_subfields:tuple):
+    """Counts added, removed & modified subfields between two snapshots of a field.
+    For each code, a removed value and an added value are counted as one modified subfield"""
+    removed = {}
+    added = {}
+    for subf in old_subfields:
+        removed[subf] = removed.get(subf, 0) + 1
+    for subf in new_subfields:
+        if removed.get(subf, 0) > 0:
+            removed[subf] -= 1
+        else:
+            added[subf.code] = added.get(subf.code, 0) + 1
+    for subf, nb in removed.items():
+        if nb == 0:
+            continue
+        nb_modified = min(nb, added.get(subf.code, 0))
+        if nb_modified > 0:
+            added[subf.code] -= nb_modified
+            __add_to_instrumentation_counter(counter, tag, "subfields_modified", nb_modified)
+        if nb > nb_modified:
+            __add_to_instrumentation_counter(counter, tag, "subfields_removed", nb - nb_modified)
+    nb_added = sum(added.values())
+    if nb_added > 0:
+        __add_to_instrumentation_counter(counter, tag, "subfields_added", nb_added)
+
+def __get_instrumentation_snapshot(field:pymarc.field.Field) -> tuple:
+    """Returns get_field_snapshot(), or (tag, __UNDECODED) for a LazyField not decoded yet"""
+    if isinstance(field, LazyField) and not field.is_decoded():
+        return (field.tag, __UNDECODED)
+    return get_field_snapshot(field)
+
+def __resolve_snapshot(field:pymarc.field.Field, snapshot:tuple) -> tuple:
+    """Returns the snapshot taken before the call, decoding the LazyField if it was not decoded then"""
+    if snapshot[1] is not __UNDECODED:
+        return snapshot
+    get_field_snapshot(field)
+    return (snapshot[0],) + field._original
+
+def __count_field_changes(counter:dict, before:list, after_fields:list):
+    """Counts added, removed & modified fields (and their subfields) between a list of
+    (field, snapshot) taken before the call and the fields after the call"""
+    before_by_id = {id(field): snapshot for field, snapshot in before}
+    after_ids = set()
+    for field in after_fields:
+        after_ids.add(id(field))
+        old_snapshot = before_by_id.get(id(field))
+        if old_snapshot is not None and old_snapshot[1] is __UNDECODED:
+            # Still not decoded : not edited
+            if not field.is_decoded() and field.tag == old_snapshot[0]:
+                continue
+            old_snapshot = __resolve_snapshot(field, old_snapshot)
+        snapshot = get_field_snapshot(field)
+        if old_snapshot is None:
+            __add_to_instrumentation_counter(counter, field.tag, "fields_added")
+            if len(snapshot) == 3:
+                __add_to_instrumentation_counter(counter, field.tag, "subfields_added", len(snapshot[2]))
+        elif old_snapshot != snapshot:
+            __add_to_instrumentation_counter(counter, field.tag, "fields_modified")
+            if len(snapshot) == 3 and len(old_snapshot) == 3:
+                __count_subfield_changes(counter, field.tag, old_snapshot[2], snapshot[2])
+    for field, snapshot in before:
+        if not id(field) in after_ids:
+            snapshot = __resolve_snapshot(field, snapshot)
+            __add_to_instrumentation_counter(counter, snapshot[0], "fields_removed")
+            if len(snapshot) == 3:
+                __add_to_instrumentation_counter(counter, snapshot[0], "subfields_removed", len(snapshot[2]))
+
+def __get_instrumented_tags(signature:inspect.Signature, tag_parameters:List[str], is_method:bool, args:tuple, kwargs:dict) -> set|None:
+    """Returns the tags a call edits (from its tag or tags argument, or the get_tags() method of the instance),
+    None if it can edit any field"""
+    if len(tag_parameters) > 0:
+        arguments = signature.bind_partial(*args, **kwargs).arguments
+        tags = set()
+        for name in tag_parameters:
+            value = arguments.get(name)
+            if value is None:
+                return None
+            tags.update([value] if isinstance(value, str) else value)
+        return tags
+    if is_method and hasattr(args[0], "get_tags"):
+        return args[0].get_tags()
+    return None
+
+def __get_instrumented_fields(record:pymarc.record.Record, tags:set|None) -> List[pymarc.field.Field]:
+    """Returns the fields of the record with one of these tags (every field if tags is None)"""
+    if tags is None:
+        return record.fields
+    if len(tags) == 0:
+        return []
+    return record.get_fields(*tags)
+
+def __instrument(name:str, func, kind:str|None, is_method:bool=False, nested:bool=False):
+    """Returns func wrapped to update the counters of name.
+    kind is "record" or "field" if func takes a record or a field as first argument.
+    Calls made inside another instrumented call are not counted (the outermost call counts them),
+    unless nested is True"""
+    signature = inspect.signature(func)
+    tag_parameters = [parameter for parameter in ["tag", "tags"] if parameter in signature.parameters]
+    position = 1 if is_method else 0
+
+    @functools.wraps(func)
+    def instrumented(*args, **kwargs):
+        if not nested:
+            if getattr(__INSTRUMENTATION_STATE, "depth", 0) > 0:
+                return func(*args, **kwargs)
+            __INSTRUMENTATION_STATE.depth = 1
+        try:
+            target = args[position] if len(args) > position else kwargs.get(kind)
+            # Snapshots (only of the fields with the tags of the call) are taken outside the timed part
+            tags = None
+            if kind is not None:
+                tags = __get_instrumented_tags(signature, tag_parameters, is_method, args, kwargs)
+            fields = None
+            if kind == "record" and isinstance(target, pymarc.record.Record):
+                fields = __get_instrumented_fields(target, tags)
+            elif kind == "field" and isinstance(target, pymarc.field.Field):
+                fields = [target]
+            before = None
+            if fields is not None:
+                before = [(field, __get_instrumentation_snapshot(field)) for field in fields]
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                counter = __INSTRUMENTATION_COUNTERS.get(name)
+                if counter is None:
+                    counter = __new_instrumentation_counter()
+                    __INSTRUMENTATION_COUNTERS[name] = counter
+                counter["calls"] += 1
+                counter["total_s"] += elapsed
+                counter["max_s"] = max(counter["max_s"], elapsed)
+                if before is not None:
+                    for field, snapshot in before:
+                        if tags is None or snapshot[0] in tags:
+                            __add_to_instrumentation_counter(counter, snapshot[0], "fields_scanned")
+                    if kind == "record":
+                        after_fields = __get_instrumented_fields(target, tags)
+                        # Fields moved to another tag (e.g. demoted by a TagFamilyNormalizer) are modified fields
+                        if tags is not None:
+                            after_fields = after_fields + [field for field, snapshot in before if not field.tag in tags]
+                    else:
+                        after_fields = [target]
+                    __count_field_changes(counter, before, after_fields)
+        finally:
+            if not nested:
+                __INSTRUMENTATION_STATE.depth = 0
+    instrumented.__instrumented__ = True
+    return instrumented
+
+def __instrument_field_handler(name:str, handler):
+    """Returns a FieldDispatchTable handler wrapped to update the counters of name,
+    the field is counted as removed if the handler deletes it.
+    Counted inside the TransformPlan.apply() call, as a breakdown of the plan"""
+    instrumented = __instrument(name, handler, "field", nested=True)
+
+    def instrumented_handler(field:pymarc.field.Field) -> bool:
+        keep = instrumented(field)
+        if not keep:
+            counter = __INSTRUMENTATION_COUNTERS[name]
+            __add_to_instrumentation_counter(counter, field.tag, "fields_removed")
+            if not field.is_control_field():
+                __add_to_instrumentation_counter(counter, field.tag, "subfields_removed", len(read_subfields(field)))
+        return keep
+    return instrumented_handler
+
+def __get_instrumentation_kind(func) -> str|None:
+    """Returns "record" or "field" depending on the first argument of func (minus self)"""
+    parameters = [parameter for parameter in inspect.signature(func).parameters if parameter != "self"]
+    if len(parameters) > 0 and parameters[0] in ["record", "field"]:
+        return parameters[0]
+    return None
+
+def enable_instrumentation():
+    """Replaces every public function of this module (and apply() of TransformPlan, SortProfile,
+    FieldDispatchTable, RuleSet, SubstitutionTable & TagFamilyNormalizer) by an instrumented version counting calls,
+    time, scanned fields and added, removed or modified fields & subfields (see get_instrumentation_snapshot()).
+    Only the outermost instrumented call of each thread is counted, calls it makes are not counted again.
+    Field operations of a TransformPlan are counted under their own name, for each field they are applied to.
+    Helpers called by other functions for each field (get_code_view(), filter_subfields(), compile_pattern(),
+    set_field_tag(), get_dedupe_key()...) are not instrumented.
+    Nothing is measured (and nothing slows down) until this is called.
+    /!\\ functions imported with from marc_utils_5 import ... before enabling are not instrumented"""
+    if is_instrumentation_enabled():
+        return
+    module_globals = globals()
+    for name, func in list(module_globals.items()):
+        if (name.startswith("_") or not inspect.isfunction(func) or func.__module__ != __name__
+                or name in __NOT_INSTRUMENTED):
+            continue
+        __INSTRUMENTED[("module", name)] = func
+        module_globals[name] = __instrument(name, func, __get_instrumentation_kind(func))
+    # TransformPlan record operations keep a reference to the function
+    for name, func in TRANSFORM_PLAN_RECORD_OPERATIONS.items():
+        __INSTRUMENTED[("TRANSFORM_PLAN_RECORD_OPERATIONS", name)] = func
+        TRANSFORM_PLAN_RECORD_OPERATIONS[name] = module_globals[name]
+    for cls in [TransformPlan, SortProfile, FieldDispatchTable, RuleSet, SubstitutionTable, TagFamilyNormalizer]:
+        method = cls.__dict__["apply"]
+        instrumented = __instrument(f"{cls.__name__}.apply", method, __get_instrumentation_kind(method), is_method=True)
+        for attribute in ["apply", "__call__"]:
+            __INSTRUMENTED[(cls, attribute)] = cls.__dict__[attribute]
+            setattr(cls, attribute, instrumented)
+    # Field operations of a TransformPlan are counted under their own name
+    # (plans compiled before are compiled again on their next apply())
+    __INSTRUMENTED[(TransformPlan, "_instrument_handler")] = None
+    TransformPlan._instrument_handler = staticmethod(__instrument_field_handler)
+
+def disable_instrumentation():
+    """Puts back the original functions, counters are kept"""
+    module_globals = globals()
+    for (owner, name), original in __INSTRUMENTED.items():
+        if owner == "module":
+            module_globals[name] = original
+        elif owner == "TRANSFORM_PLAN_RECORD_OPERATIONS":
+            TRANSFORM_PLAN_RECORD_OPERATIONS[name] = original
+        else:
+            setattr(owner, name, original)
+    __INSTRUMENTED.clear()
+
+def is_instrumentation_enabled() -> bool:
+    """Returns True if the instrumentation is enabled"""
+    return len(__INSTRUMENTED) > 0
+
+def reset_instrumentation():
+    """Resets every counter"""
+    __INSTRUMENTATION_COUNTERS.clear()
+
+def get_instrumentation_snapshot() -> dict:
+    """Returns a copy of the counters as a JSON serializable dict : function name -> dict with
+    calls, total_s, max_s, fields_scanned, fields_added, fields_removed, fields_modified,
+    subfields_added, subfields_removed, subfields_modified & tags (the same counters minus the
+    time for each field tag).
+    Fields are only counted for functions taking a record or a field as first argument,
+    fields_scanned are the fields with the tags given to the function (every field if it has no tag or tags argument)"""
+    return json.loads(json.dumps(__INSTRUMENTATION_COUNTERS))
+
+def merge_instrumentation_snapshots(snapshots:Iterable[dict]) -> dict:
+    """Returns a snapshot adding up the counters of several snapshots (e.g. from worker processes),
+    keeping the highest max_s"""
+    output = {}
+    for snapshot in snapshots:
+        for name, counter in snapshot.items():
+            if not name in output:
+                output[name] = __new_instrumentation_counter()
+            merged = output[name]
+            merged["calls"] += counter["calls"]
+            merged["total_s"] += counter["total_s"]
+            merged["max_s"] = max(merged["max_s"], counter["max_s"])
+            for counter_name in __INSTRUMENTATION_COUNTER_NAMES:
+                merged[counter_name] += counter[counter_name]
+                for tag, tag_counter in counter["tags"].items():
+                    if tag_counter[counter_name] > 0:
+                        __add_to_instrumentation_counter(merged, tag, counter_name, tag_counter[counter_name])
+                        # Only the tag breakdown, the total is already added
+                        merged[counter_name] -= tag_counter[counter_name]
+    return output
+
+def export_instrumentation(file, snapshot:dict|None=None):
+    """Writes a snapshot (the current counters if None) as JSON in a file
+
+    Takes as argument :
+        - file : a path (str) or a text file opened in write mode
+        - [OPTIONNAL, None] snapshot {dict} : the snapshot to write"""
+    if snapshot is None:
+        snapshot = get_instrumentation_snapshot()
+    if isinstance(file, str):
+        with open(file, "w", encoding="utf-8") as opened_file:
+            json.dump(snapshot, opened_file, indent=2)
+    else:
+        json.dump(snapshot, file, indent=2)